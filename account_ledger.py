@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+"""
+Account Ledger
+
+A local copy of the account (cash, positions, portfolio value) so the sizing decisions of an iteration don't
+ask the broker again for every symbol:
+
+- refresh() seeds the ledger from the broker (get_orders, get_cash, get_positions, get_portfolio_value: one call
+  each), at most once every reconcile_interval seconds; call it at the start of the iteration
+- orders submitted through submit() are kept as pending: their estimated cost is taken out of available_cash
+  and their quantity counts in potential_total, like get_asset_potential_total does
+- fills, cancels and errors (through AccountLedgerMixin's lumibot callbacks) update cash, positions and pending
+  orders
+- every time the ledger is seeded, the pending orders are checked against the broker's orders (get_orders) and
+  only the ones still active are kept, so an order that never got a callback (rejected, expired, or a strategy
+  run outside lumibot's executor) doesn't reserve cash forever; a late callback of a dropped order is ignored,
+  the broker's numbers already include it. Active orders the ledger didn't submit (still open after a restart,
+  placed by another path) are added to the pending orders.
+- what the ledger expected is then compared with what the broker reports and every difference larger than
+  drift_tolerance is logged as drift (e.g. fees, an order placed outside the strategy, a fill callback that never
+  came); the broker's numbers then replace the local ones
+- a fill or cancel callback arriving while the broker is being read makes the ledger read it again, so the
+  callback isn't overwritten by a snapshot taken before it
+
+When backtesting the ledger is seeded on every refresh, the backtest broker doesn't cost anything.
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class AccountLedger:
+    def __init__(self, strategy, reconcile_interval=300, drift_tolerance=0.01):
+        self.strategy = strategy
+
+        # Seconds between two reconciliations with the broker
+        self.reconcile_interval = 0 if strategy.is_backtesting else reconcile_interval
+
+        # Drift larger than this share of the portfolio value (cash) or of the position (quantity) is reported
+        self.drift_tolerance = drift_tolerance
+
+        self.cash = 0.0
+        self.portfolio_value = 0.0
+
+        # symbol -> quantity held and symbol -> Asset
+        self.positions = {}
+        self.assets = {}
+
+        # order identifier -> [symbol, side, quantity left, estimated price]
+        self.pending = {}
+
+        # Identifiers of the orders dropped from pending at a reconciliation (the most recent ones)
+        self.settled = OrderedDict()
+        self.max_settled = 1000
+
+        self.seeded_at = None
+        self.drift_count = 0
+
+        # Fill, cancel and error callbacks applied so far, a refresh reads the broker again if one came meanwhile
+        self.callback_count = 0
+        self.max_snapshot_attempts = 3
+        self.lock = threading.RLock()
+
+    # =============Broker===================
+
+    def refresh(self, force=False):
+        """Seed the ledger from the broker if a reconciliation is due, return True if it was"""
+        if not force and self.seeded_at is not None and time.monotonic() - self.seeded_at < self.reconcile_interval:
+            return False
+
+        # A callback applied while the broker is being read may or may not be in its numbers: read them again
+        for _ in range(self.max_snapshot_attempts):
+            with self.lock:
+                callbacks = self.callback_count
+                # Only the orders already pending now are checked, an order submitted meanwhile isn't in get_orders yet
+                pending_ids = list(self.pending)
+
+            snapshot = self._read_broker()
+            with self.lock:
+                if self.callback_count == callbacks:
+                    self._seed(pending_ids, *snapshot)
+                    return True
+
+        # Orders keep filling, keep the local numbers until the next refresh
+        logger.info("Account ledger not seeded, order callbacks kept arriving while reading the broker")
+        return False
+
+    def _read_broker(self):
+        active_orders, filled_ids = {}, set()
+        for order in self.strategy.get_orders():
+            if order.is_active():
+                active_orders[order.identifier] = order
+            elif order.is_filled():
+                filled_ids.add(order.identifier)
+
+        cash = self.strategy.get_cash()
+        quote = getattr(self.strategy, "quote_asset", None)
+        positions = {}
+        assets = {}
+        for position in self.strategy.get_positions():
+            if quote is not None and position.asset == quote:
+                continue
+            symbol = position.asset.symbol
+            positions[symbol] = float(position.quantity)
+            assets[symbol] = position.asset
+        portfolio_value = self.strategy.get_portfolio_value()
+        return active_orders, filled_ids, cash, positions, assets, portfolio_value
+
+    def _seed(self, pending_ids, active_orders, filled_ids, cash, positions, assets, portfolio_value):
+        # Drop the pending orders that aren't active at the broker anymore
+        unseen_fills = set()
+        for identifier in pending_ids:
+            if identifier in active_orders or identifier not in self.pending:
+                continue
+            if identifier in filled_ids:
+                # Filled without a callback (yet), the broker's cash and positions include it
+                unseen_fills.add(self.pending[identifier][0])
+            del self.pending[identifier]
+            self.settled[identifier] = True
+            if len(self.settled) > self.max_settled:
+                self.settled.popitem(last=False)
+
+        if self.seeded_at is not None:
+            self._check_drift(cash, positions, portfolio_value, unseen_fills)
+
+        # Adopt the active orders the ledger didn't submit (still open from before a restart, placed by another
+        # path), so potential_total counts them like get_asset_potential_total did
+        for identifier, order in active_orders.items():
+            if identifier not in self.pending:
+                self.assets.setdefault(order.asset.symbol, order.asset)
+                self.pending[identifier] = self._pending_entry(order)
+
+        self.cash = float(cash)
+        self.positions = positions
+        self.assets.update(assets)
+        self.portfolio_value = float(portfolio_value)
+        self.seeded_at = time.monotonic()
+
+    @staticmethod
+    def _pending_entry(order, price=None):
+        # What's left of a partially filled order, the limit price when no estimate is given
+        quantity = float(order.quantity) - float(getattr(order, "filled_quantity", None) or 0)
+        if price is None:
+            price = getattr(order, "limit_price", None) or 0.0
+        return [order.asset.symbol, order.side, quantity, float(price)]
+
+    def _check_drift(self, cash, positions, portfolio_value, unseen_fills):
+        drift = []
+
+        # Orders filled at the broker whose callback we haven't seen would look like drift. Active orders don't
+        # move the broker's cash until they fill, but a partial fill may be in flight for their positions.
+        if not unseen_fills and abs(cash - self.cash) > self.drift_tolerance * max(portfolio_value, 1):
+            drift.append(f"cash {self.cash:,.2f} expected, {cash:,.2f} at the broker")
+
+        skipped_symbols = unseen_fills | {entry[0] for entry in self.pending.values()}
+        for symbol in set(positions) | set(self.positions):
+            if symbol in skipped_symbols:
+                continue
+            expected = self.positions.get(symbol, 0.0)
+            actual = positions.get(symbol, 0.0)
+            if abs(actual - expected) > self.drift_tolerance * max(abs(expected), abs(actual), 1):
+                drift.append(f"{symbol} {expected} expected, {actual} at the broker")
+
+        if drift:
+            self.drift_count += 1
+            logger.warning(f"Account ledger drifted from the broker: {'; '.join(drift)}")
+
+    # =============Local view===================
+
+    @property
+    def available_cash(self):
+        """Cash minus the estimated cost of the pending buy orders"""
+        with self.lock:
+            reserved = sum(quantity * price for _, side, quantity, price in self.pending.values() if side == "buy")
+            return self.cash - reserved
+
+    def position(self, symbol):
+        return self.positions.get(symbol, 0.0)
+
+    def potential_total(self, symbol):
+        """Quantity held plus pending buys minus pending sells"""
+        with self.lock:
+            total = self.positions.get(symbol, 0.0)
+            for pending_symbol, side, quantity, _ in self.pending.values():
+                if pending_symbol == symbol:
+                    total += quantity if side == "buy" else -quantity
+            return total
+
+    # =============Orders===================
+
+    def submit(self, order, price=0.0):
+        """Submit an order to the broker and keep it as pending
+
+        price is the estimated fill price, used to reserve the cash of buy orders.
+        """
+        submitted = self.strategy.submit_order(order) or order
+        symbol = submitted.asset.symbol
+        with self.lock:
+            self.assets.setdefault(symbol, submitted.asset)
+            self.pending[submitted.identifier] = self._pending_entry(submitted, price)
+        return submitted
+
+    def on_fill(self, order, price, quantity, multiplier=1, partial=False):
+        with self.lock:
+            self.callback_count += 1
+
+            # Dropped at a reconciliation, the broker's numbers we seeded from already include this fill
+            if order.identifier in self.settled:
+                return
+
+            symbol = order.asset.symbol
+            quantity = float(quantity)
+            sign = 1 if order.side == "buy" else -1
+
+            # The final fill of a pending order completes whatever partial fills left
+            entry = self.pending.get(order.identifier)
+            if entry is not None and not partial:
+                quantity = entry[2]
+
+            self.positions[symbol] = self.positions.get(symbol, 0.0) + sign * quantity
+            if self.positions[symbol] == 0:
+                del self.positions[symbol]
+            self.cash -= sign * quantity * float(price) * (multiplier or 1)
+
+            if entry is not None:
+                entry[2] -= quantity
+                if not partial or entry[2] <= 0:
+                    del self.pending[order.identifier]
+
+    def on_cancel(self, order):
+        with self.lock:
+            self.callback_count += 1
+            self.pending.pop(order.identifier, None)
+
+
+class AccountLedgerMixin:
+    """Keep a strategy's self.ledger up to date with lumibot's order callbacks"""
+
+    ledger = None
+
+    def on_filled_order(self, position, order, price, quantity, multiplier):
+        if self.ledger is not None:
+            self.ledger.on_fill(order, price, quantity, multiplier)
+
+    def on_partially_filled_order(self, position, order, price, quantity, multiplier):
+        if self.ledger is not None:
+            self.ledger.on_fill(order, price, quantity, multiplier, partial=True)
+
+    def on_canceled_order(self, order):
+        if self.ledger is not None:
+            self.ledger.on_cancel(order)
+
+    def on_error_order(self, order, error=None):
+        # A rejected order will never fill
+        if self.ledger is not None:
+            self.ledger.on_cancel(order)
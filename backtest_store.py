@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+"""
+Backtest Result Store
+
+Every backtest run is saved to a columnar (parquet) store, keyed by the strategy name and its parameters.
+Each run writes one file per table (equity, trades, orders, positions) with a "run_id" column, so a whole
+table can be read back in a single call and compared across hundreds of runs with vectorized pandas/numpy
+operations instead of a pile of CSV and HTML files.
+
+Layout:
+    backtest_results/
+        runs/<run_id>.parquet
+        equity/<run_id>.parquet
+        trades/<run_id>.parquet
+        orders/<run_id>.parquet
+        positions/<run_id>.parquet
+
+"""
+
+def make_run_id(strategy_name, parameters):
+    """Build a stable id from the strategy name and its parameters"""
+    key = json.dumps(
+        {"strategy": strategy_name, "parameters": parameters},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def equity_metrics(equity, traded_value=None, periods_per_year=252, risk_free_rate=0.0):
+    """Compute CAGR, max drawdown, Sharpe and turnover of every column of a wide equity frame
+
+    traded_value is the total traded value of every column (a Series), used for the annual turnover.
+    """
+    values = equity.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    # First and last valid value of every run
+    first_idx = valid.argmax(axis=0)
+    last_idx = len(values) - 1 - valid[::-1].argmax(axis=0)
+    cols = np.arange(values.shape[1])
+    first_value = values[first_idx, cols]
+    last_value = values[last_idx, cols]
+    dates = equity.index.to_numpy()
+    years = (dates[last_idx] - dates[first_idx]) / np.timedelta64(1, "D") / 365.25
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where(years > 0, (last_value / first_value) ** (1 / years) - 1, np.nan)
+
+        # Drawdown against the running peak
+        peak = np.fmax.accumulate(values, axis=0)
+        max_drawdown = np.nanmin(values / peak - 1, axis=0)
+
+        # Sharpe from the periodic returns of every run over its own rows: runs stamped at other times
+        # (e.g. midnight vs 15:59) are NaN on each other's rows of the union index
+        previous = equity.ffill().shift().to_numpy(dtype=np.float64)
+        returns = np.where(valid, values / previous - 1, np.nan)
+        excess = returns - risk_free_rate / periods_per_year
+        sharpe = np.nanmean(excess, axis=0) / np.nanstd(excess, axis=0, ddof=1) * np.sqrt(periods_per_year)
+
+        # Annual turnover: traded value over the average equity, per year
+        if traded_value is not None:
+            traded = pd.Series(traded_value).reindex(equity.columns).fillna(0).to_numpy(dtype=np.float64)
+            turnover = traded / np.nanmean(values, axis=0) / years
+        else:
+            turnover = np.full(values.shape[1], np.nan)
+
+    return pd.DataFrame(
+        {
+            "start": dates[first_idx],
+            "end": dates[last_idx],
+            "start_value": first_value,
+            "end_value": last_value,
+            "cagr": cagr,
+            "max_drawdown": max_drawdown,
+            "sharpe": sharpe,
+            "turnover": turnover,
+        },
+        index=equity.columns,
+    )
+
+
+class BacktestStore:
+    def __init__(self, root="backtest_results"):
+        self.root = root
+
+    # =============Writing runs===================
+
+    def save_run(self, strategy_name, parameters, equity, trades=None, orders=None, positions=None):
+        """Persist a backtest run and return its run id
+
+        equity is a Series (or DataFrame with a "portfolio_value" column) indexed by datetime.
+        trades, orders and positions are DataFrames or lists of records.
+        Saving the same strategy and parameters again overwrites the previous run.
+        """
+        run_id = make_run_id(strategy_name, parameters)
+
+        # Normalize the equity curve to a two column frame
+        if isinstance(equity, pd.DataFrame):
+            equity = equity["portfolio_value"]
+        equity_df = pd.DataFrame(
+            {
+                "datetime": pd.to_datetime(equity.index),
+                "portfolio_value": np.asarray(equity, dtype=np.float64),
+            }
+        )
+
+        run_df = pd.DataFrame(
+            [
+                {
+                    "run_id": run_id,
+                    "strategy": strategy_name,
+                    "parameters": json.dumps(parameters, sort_keys=True, default=str),
+                    "created_at": datetime.now(),
+                }
+            ]
+        )
+
+        self._write("runs", run_id, run_df)
+        self._write("equity", run_id, equity_df)
+        self._write("trades", run_id, self._to_frame(trades))
+        self._write("orders", run_id, self._to_frame(orders))
+        self._write("positions", run_id, self._to_frame(positions))
+
+        return run_id
+
+    def save_lumibot_run(self, strategy_name, parameters, strategy):
+        """Persist the results of a lumibot backtest from the strategy returned by run_backtest"""
+        # Equity curve kept by lumibot for the tearsheet
+        returns_df = getattr(strategy, "_strategy_returns_df", None)
+        if returns_df is not None and "portfolio_value" in returns_df:
+            equity = returns_df["portfolio_value"]
+        else:
+            equity = pd.Series(dtype=np.float64)
+
+        # The backtesting broker logs every order event, fills are the trades
+        orders = getattr(strategy.broker, "_trade_event_log_df", None)
+        trades = None
+        if orders is not None and "status" in orders:
+            trades = orders[orders["status"] == "fill"]
+
+        # Final positions
+        positions = []
+        for position in strategy.get_positions():
+            positions.append(
+                {
+                    "symbol": position.asset.symbol,
+                    "quantity": float(position.quantity),
+                    "last_price": strategy.get_last_price(position.asset),
+                }
+            )
+
+        return self.save_run(strategy_name, parameters, equity, trades, orders, positions)
+
+    # =============Reading runs===================
+
+    def runs(self):
+        """Return one row per stored run with its strategy name and parameters"""
+        return self._read("runs")
+
+    def equity(self, run_ids=None):
+        """Return the equity curves as a wide frame (datetime x run_id)"""
+        df = self._read("equity", run_ids)
+        if df.empty:
+            return pd.DataFrame()
+        return df.pivot(index="datetime", columns="run_id", values="portfolio_value").sort_index()
+
+    def trades(self, run_ids=None):
+        return self._read("trades", run_ids)
+
+    def orders(self, run_ids=None):
+        return self._read("orders", run_ids)
+
+    def positions(self, run_ids=None):
+        return self._read("positions", run_ids)
+
+    def summary(self, run_ids=None, periods_per_year=252, risk_free_rate=0.0):
+        """Compute CAGR, max drawdown, turnover and Sharpe for every run in one pass
+
+        All metrics are computed column-wise on the wide equity frame (see equity_metrics), so comparing
+        hundreds of runs costs about the same as comparing one.
+        """
+        equity = self.equity(run_ids)
+        if equity.empty:
+            return pd.DataFrame()
+        runs = self.runs().set_index("run_id")[["strategy", "parameters"]]
+
+        # Traded value of every run for the turnover
+        trades = self.trades(list(equity.columns))
+        traded_value = None
+        if not trades.empty and {"price", "filled_quantity"} <= set(trades.columns):
+            value = trades["price"].astype(float) * trades["filled_quantity"].astype(float).abs()
+            traded_value = value.groupby(trades["run_id"]).sum()
+
+        result = equity_metrics(equity, traded_value, periods_per_year, risk_free_rate)
+        return runs.join(result, how="inner")
+
+    # =============Helper methods===================
+
+    def _to_frame(self, data):
+        if data is None:
+            return pd.DataFrame()
+        if isinstance(data, pd.DataFrame):
+            return data.reset_index(drop=True)
+        return pd.DataFrame.from_records(data)
+
+    def _write(self, table, run_id, df):
+        folder = os.path.join(self.root, table)
+        os.makedirs(folder, exist_ok=True)
+
+        df = df.copy()
+        df["run_id"] = run_id
+
+        # Object columns (assets, enums, ...) are stored as strings so any run can be read back
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].map(lambda value: value if value is None else str(value))
+
+        # Write to a temporary file first so readers never see a half written run
+        path = os.path.join(folder, f"{run_id}.parquet")
+        tmp_path = path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, table, run_ids=None):
+        folder = os.path.join(self.root, table)
+        if not os.path.isdir(folder):
+            return pd.DataFrame()
+
+        if run_ids is None:
+            files = [name for name in os.listdir(folder) if name.endswith(".parquet")]
+        else:
+            files = [f"{run_id}.parquet" for run_id in run_ids]
+        files = [os.path.join(folder, name) for name in sorted(files)]
+        files = [path for path in files if os.path.exists(path)]
+
+        frames = [pd.read_parquet(path) for path in files]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    # Print the comparison table of every stored run
+    pd.set_option("display.width", 200)
+    print(BacktestStore().summary().sort_values("cagr", ascending=False))
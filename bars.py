@@ -0,0 +1,290 @@
+from datetime import datetime
+
+import numpy as np
+
+"""
+Compact Bars
+
+Bars as one packed NumPy structured array instead of a DataFrame (or one object per streamed message):
+32 bytes per bar (int64 timestamp in ns since epoch, float32 open/high/low/close, int64 volume), no index and
+no per-bar Python object.
+
+- BarArray is an append-only buffer of bars with an optional maxlen (a ring buffer keeping the last maxlen bars);
+  the columns (bars.close, bars.timestamp, ...) are views, nothing is copied to read them
+- BarArray.from_buffer wraps bytes (e.g. read from a file or a socket) without copying them
+- BarArray.from_records converts the raw bars of the Alpaca API ({"t", "o", "h", "l", "c", "v"}) and
+  BarArray.from_dataframe the DataFrames of get_bars(...).df / get_historical_prices(...).df
+- Bar is a single bar with __slots__, for the streaming handlers
+
+"""
+
+BAR_DTYPE = np.dtype(
+    [
+        ("timestamp", "<i8"),
+        ("open", "<f4"),
+        ("high", "<f4"),
+        ("low", "<f4"),
+        ("close", "<f4"),
+        ("volume", "<i8"),
+    ]
+)
+
+# Short and long field names used by Alpaca and Polygon messages
+FIELD_NAMES = {
+    "timestamp": ("t", "timestamp", "start", "s"),
+    "open": ("o", "open"),
+    "high": ("h", "high"),
+    "low": ("l", "low"),
+    "close": ("c", "close"),
+    "volume": ("v", "volume"),
+}
+
+
+def to_nanoseconds(value):
+    """Timestamp in ns since epoch from a datetime, an ISO string, or an int in s, ms or ns"""
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        if value < 10**11:
+            return value * 10**9
+        if value < 10**14:
+            return value * 10**6
+        return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return int(np.datetime64(value, "ns").astype(np.int64))
+        return int(value.timestamp()) * 10**9 + value.microsecond * 1000
+    if isinstance(value, str):
+        # numpy only parses UTC times without the zone
+        value = value.replace("Z", "").replace("+00:00", "")
+    return int(np.datetime64(value, "ns").astype(np.int64))
+
+
+def _field(raw, name):
+    for key in FIELD_NAMES[name]:
+        if key in raw:
+            return raw[key]
+    raise KeyError(name)
+
+
+class Bar:
+    __slots__ = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp, open, high, low, close, volume):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Bar from a raw message dict (Alpaca or Polygon field names)"""
+        return cls(
+            to_nanoseconds(_field(raw, "timestamp")),
+            float(_field(raw, "open")),
+            float(_field(raw, "high")),
+            float(_field(raw, "low")),
+            float(_field(raw, "close")),
+            int(_field(raw, "volume")),
+        )
+
+    @classmethod
+    def from_message(cls, message):
+        """Bar from a stream message (an alpaca entity, a replayed message or a dict)"""
+        if isinstance(message, Bar):
+            return message
+        if hasattr(message, "_raw"):
+            return cls.from_raw(message._raw)
+        if isinstance(message, dict):
+            return cls.from_raw(message)
+        return cls.from_raw(vars(message))
+
+    @property
+    def datetime(self):
+        """Naive UTC datetime of the bar"""
+        return np.datetime64(self.timestamp // 1000, "us").astype(datetime)
+
+    def __repr__(self):
+        return (
+            f"Bar({np.datetime64(self.timestamp, 'ns')} o={self.open} h={self.high} l={self.low} "
+            f"c={self.close} v={self.volume})"
+        )
+
+
+class BarArray:
+    def __init__(self, capacity=1024, maxlen=None):
+        # Keep the last maxlen bars only (None to keep them all)
+        self.maxlen = maxlen
+        if maxlen is not None:
+            # Twice maxlen so the window is moved back to the front only once every maxlen bars
+            capacity = 2 * maxlen
+        self.data = np.empty(capacity, dtype=BAR_DTYPE)
+        self.start = 0
+        self.end = 0
+
+        # False while data is memory of the caller (from_array, from_buffer, a slice), copied before the first write
+        self.owned = True
+
+    # =============Constructors===================
+
+    @classmethod
+    def from_array(cls, array, maxlen=None):
+        """Wrap a structured array of BAR_DTYPE (no copy until the first append, the array is never written)"""
+        bars = cls(capacity=0)
+        bars.maxlen = maxlen
+        if maxlen is not None and len(array) > maxlen:
+            array = array[-maxlen:]
+        bars.data = array
+        bars.end = len(array)
+        bars.owned = False
+        return bars
+
+    @classmethod
+    def from_buffer(cls, buffer, maxlen=None):
+        """Wrap bytes of packed bars without copying them"""
+        return cls.from_array(np.frombuffer(buffer, dtype=BAR_DTYPE), maxlen)
+
+    @classmethod
+    def from_records(cls, records, maxlen=None):
+        """Bars from raw bar dicts, e.g. [bar._raw for bar in api.get_bars(...)]"""
+        records = list(records)
+        array = np.empty(len(records), dtype=BAR_DTYPE)
+        if records:
+            array["timestamp"] = [to_nanoseconds(_field(raw, "timestamp")) for raw in records]
+            for name in ("open", "high", "low", "close", "volume"):
+                array[name] = [_field(raw, name) for raw in records]
+        return cls._from_new_array(array, maxlen)
+
+    @classmethod
+    def from_dataframe(cls, df, maxlen=None):
+        """Bars from a DataFrame with open/high/low/close/volume columns and a datetime index"""
+        array = np.empty(len(df), dtype=BAR_DTYPE)
+        index = df.index
+        if getattr(index, "tz", None) is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        array["timestamp"] = np.asarray(index, dtype="datetime64[ns]").astype(np.int64)
+        for name in ("open", "high", "low", "close", "volume"):
+            array[name] = df[name].to_numpy()
+        return cls._from_new_array(array, maxlen)
+
+    @classmethod
+    def _from_new_array(cls, array, maxlen):
+        # The array was built for these bars, appends can write in it
+        bars = cls.from_array(array, maxlen)
+        bars.owned = True
+        return bars
+
+    # =============Access===================
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def array(self):
+        """Structured array of the bars (a view)"""
+        return self.data[self.start : self.end]
+
+    @property
+    def timestamp(self):
+        return self.array["timestamp"]
+
+    @property
+    def open(self):
+        return self.array["open"]
+
+    @property
+    def high(self):
+        return self.array["high"]
+
+    @property
+    def low(self):
+        return self.array["low"]
+
+    @property
+    def close(self):
+        return self.array["close"]
+
+    @property
+    def volume(self):
+        return self.array["volume"]
+
+    @property
+    def nbytes(self):
+        return len(self) * BAR_DTYPE.itemsize
+
+    def __getitem__(self, i):
+        # A slice shares the bars until it is updated
+        if isinstance(i, slice):
+            return BarArray.from_array(self.array[i])
+        return Bar(*(value.item() for value in self.array[i]))
+
+    def last(self):
+        return self[-1] if len(self) else None
+
+    def tail(self, n):
+        """Structured array of the last n bars (a view)"""
+        return self.data[max(self.start, self.end - n) : self.end]
+
+    def since(self, timestamp):
+        """Structured array of the bars at or after timestamp (a view)"""
+        return self.array[np.searchsorted(self.timestamp, to_nanoseconds(timestamp)) :]
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        array = self.array
+        index = pd.to_datetime(array["timestamp"], utc=True)
+        return pd.DataFrame({name: array[name] for name in BAR_DTYPE.names[1:]}, index=index)
+
+    # =============Updates===================
+
+    def append(self, bar):
+        """Add a Bar (or a stream message) at the end"""
+        bar = Bar.from_message(bar)
+        self.extend(np.array([(bar.timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume)], dtype=BAR_DTYPE))
+
+    def extend(self, bars):
+        """Add bars at the end, replacing the bars of the same or later times (e.g. a partial last bar)"""
+        if isinstance(bars, BarArray):
+            bars = bars.array
+        if len(bars) == 0:
+            return
+
+        # Drop the bars this update replaces
+        if len(self):
+            self.end = self.start + np.searchsorted(self.timestamp, bars["timestamp"][0])
+
+        if self.maxlen is not None:
+            bars = bars[-self.maxlen :]
+            # Forget the oldest bars to make room
+            self.start = max(self.start, self.end - (self.maxlen - len(bars)))
+        self._reserve(len(bars))
+        self.data[self.end : self.end + len(bars)] = bars
+        self.end += len(bars)
+
+    def _reserve(self, count):
+        if self.owned and self.end + count <= len(self.data):
+            return
+
+        # Move the window to the front of the buffer, or of a new one if it's too small (or not ours)
+        size = len(self)
+        capacity = len(self.data) if self.owned else 0
+        if size + count > capacity:
+            capacity = 2 * self.maxlen if self.maxlen is not None else max(size + count, 2 * capacity, 16)
+            data = np.empty(capacity, dtype=BAR_DTYPE)
+        else:
+            data = self.data
+        data[:size] = self.array
+        self.data = data
+        self.start = 0
+        self.end = size
+        self.owned = True
+
+    # Pickle only the bars of the window (e.g. in checkpoints)
+    def __getstate__(self):
+        return {"maxlen": self.maxlen, "bars": self.array.tobytes()}
+
+    def __setstate__(self, state):
+        array = np.frombuffer(state["bars"], dtype=BAR_DTYPE)
+        self.__dict__.update(BarArray.from_array(array, state["maxlen"]).__dict__)
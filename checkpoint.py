@@ -0,0 +1,73 @@
+import os
+import pickle
+import tempfile
+import time
+
+"""
+Strategy State Checkpoints
+
+Compact snapshots of strategy state (counters, last trades, open position flags) and cached market data,
+written to local disk so that a restart (e.g. systemd's Restart=always) picks up where the process left off
+instead of re-downloading history and re-deriving state.
+
+Snapshots are pickled with the highest protocol and written atomically: the state is written to a temporary
+file in the same folder and then renamed over the previous snapshot, so a crash during a write never leaves
+a truncated checkpoint behind.
+
+"""
+
+# On Lambda only /tmp is writable, so the folder can be moved with the CHECKPOINT_DIR environment variable
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "checkpoints")
+
+
+class Checkpoint:
+    def __init__(self, name, interval=60, folder=CHECKPOINT_DIR):
+        self.path = os.path.join(folder, f"{name}.pkl")
+
+        # Minimum number of seconds between two periodic snapshots
+        self.interval = interval
+
+        # None until the first save: time.monotonic() counts from boot, so 0 could still be within interval
+        self.last_save = None
+
+    def load(self):
+        """Return the last saved state, or an empty dict if there is none"""
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # An unreadable snapshot is treated as no snapshot
+            return {}
+
+    def save(self, state, force=False):
+        """Write a snapshot of the state
+
+        Periodic saves are skipped until interval seconds have passed since the last one. Use
+        force=True right after a trade so the position is never lost (or traded twice) on a restart.
+        """
+        now = time.monotonic()
+        if not force and self.last_save is not None and now - self.last_save < self.interval:
+            return False
+
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.last_save = now
+        return True
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
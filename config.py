@@ -7,7 +7,6 @@
 # etc.
 
 # import os
-from lumibot.brokers import Alpaca, Ccxt, Tradier
 
 # import dotenv
 
@@ -80,27 +79,49 @@ COINBASE_CONFIG = {
 #     "sandbox": False,
 }
 
-if IS_BACKTESTING:
-    broker = None
-else:
+_broker = None
+
+
+def get_broker():
+    """Create the broker from the configured credentials
+
+    lumibot's brokers are only imported here, so importing this file stays cheap (e.g. on a Lambda cold start).
+    """
+    global _broker
+
+    if IS_BACKTESTING:
+        return None
+
+    if _broker is not None:
+        return _broker
+
+    from lumibot.brokers import Alpaca, Ccxt, Tradier
+
     # If using Alpaca as a broker, set that as the broker
-    if ALPACA_CONFIG["API_KEY"]:
-        broker = Alpaca(ALPACA_CONFIG)
+    if ALPACA_CONFIG.get("API_KEY"):
+        _broker = Alpaca(ALPACA_CONFIG)
 
     # If using Tradier as a broker, set that as the broker
-    elif TRADIER_CONFIG["ACCESS_TOKEN"]:
-        broker = Tradier(TRADIER_CONFIG)
+    elif TRADIER_CONFIG.get("ACCESS_TOKEN"):
+        _broker = Tradier(TRADIER_CONFIG)
 
     # If using Coinbase as a broker, set that as the broker
-    elif COINBASE_CONFIG["apiKey"]:
-        broker = Ccxt(COINBASE_CONFIG)
+    elif COINBASE_CONFIG.get("apiKey"):
+        _broker = Ccxt(COINBASE_CONFIG)
 
     # If using Kraken as a broker, set that as the broker
-    elif KRAKEN_CONFIG["apiKey"]:
-        broker = Ccxt(KRAKEN_CONFIG)
+    elif KRAKEN_CONFIG.get("apiKey"):
+        _broker = Ccxt(KRAKEN_CONFIG)
 
     # If no broker is set, raise an error
     else:
         raise ValueError("No broker set! Please set a broker in a .env file or as a secret.")
 
+    return _broker
+
 
+def __getattr__(name):
+    # "from config import broker" creates the broker on first use
+    if name == "broker":
+        return get_broker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,15 @@
 import math
 from datetime import datetime
 
-from lumibot.entities import Asset, TradingFee
+from lumibot.entities import Asset
 from lumibot.strategies.strategy import Strategy
-from lumibot.traders import Trader
 
+from account_ledger import AccountLedger, AccountLedgerMixin
+from checkpoint import Checkpoint
 from config import IS_BACKTESTING
+from profiling import profiled
+from quote_aggregator import QuoteAggregator, venues_from_config
+from strategy_scheduler import SharedDataMixin
 
 """
 Strategy Description
@@ -20,7 +24,7 @@ if you have 3 assets in your portfolio, each with a weight of 0.33, then each as
 """
 
 
-class CustomETF(Strategy):
+class CustomETF(AccountLedgerMixin, SharedDataMixin, Strategy):
     # =====Overloading lifecycle methods=============
 
     parameters = {
@@ -61,6 +65,22 @@ class CustomETF(Strategy):
         # Setting the counter
         self.counter = None
 
+        # Restore the counter saved before the last restart so we don't rebalance early
+        self.checkpoint = Checkpoint(self.name)
+        if not self.is_backtesting:
+            self.counter = self.checkpoint.load().get("counter")
+
+        # Quote the assets on every configured venue at once when trading live
+        self.quote_aggregator = None
+        if not self.is_backtesting:
+            venues = venues_from_config()
+            if venues:
+                self.quote_aggregator = QuoteAggregator(venues)
+
+        # Local copy of the account, seeded from the broker once per rebalance and updated by the order callbacks
+        self.ledger = AccountLedger(self)
+
+    @profiled()
     def on_trading_iteration(self):
         # If the target number of minutes (period) has passed, rebalance the portfolio
         if self.counter == self.parameters["rebalance_period"] or self.counter is None:
@@ -76,11 +96,31 @@ class CustomETF(Strategy):
 
         self.counter += 1
 
+        if not self.is_backtesting:
+            self.checkpoint.save({"counter": self.counter}, force=True)
+
     # =============Helper methods===================
 
     def rebalance_portfolio(self):
         """Rebalance the portfolio and create orders"""
         orders = []
+
+        # Seed the account ledger from the broker, the sizing below doesn't ask the broker again
+        self.ledger.refresh()
+        portfolio_value = self.ledger.portfolio_value
+
+        # Last price of every asset we create an order for, to estimate its cost
+        prices = {}
+
+        # Get the prices of all the assets from all the venues in one snapshot
+        snapshot = None
+        snapshot_quote = self.parameters["portfolio"][0].get("quote").symbol
+        if self.quote_aggregator is not None:
+            snapshot = self.quote_aggregator.snapshot(
+                [asset.get("asset").symbol for asset in self.parameters["portfolio"]],
+                quote=snapshot_quote,
+            )
+
         for asset in self.parameters["portfolio"]:
             # Get all of our variables from portfolio
             asset_to_trade = asset.get("asset")
@@ -88,7 +128,13 @@ class CustomETF(Strategy):
             quote = asset.get("quote")
             symbol = asset_to_trade.symbol
 
-            last_price = self.get_last_price(asset_to_trade, quote=quote)
+            last_price = None
+            if snapshot is not None and quote.symbol == snapshot_quote:
+                last_price = snapshot.price(symbol)
+
+            # Fall back to the broker if no venue had a fresh price
+            if last_price is None:
+                last_price = self.get_last_price(asset_to_trade, quote=quote)
 
             if last_price is None:
                 self.log_message(
@@ -97,15 +143,15 @@ class CustomETF(Strategy):
                 continue
 
             self.log_message(
-                f"Last price for {symbol} is {last_price:,f}, and our weight is {weight}. Current portfolio value is {self.portfolio_value}"
+                f"Last price for {symbol} is {last_price:,f}, and our weight is {weight}. Current portfolio value is {portfolio_value}"
             )
 
             # Get how many shares we already own
             # (including orders that haven't been executed yet)
-            quantity = self.get_asset_potential_total(asset_to_trade)
+            quantity = self.ledger.potential_total(symbol)
 
             # Calculate how many shares we need to buy or sell
-            shares_value = self.portfolio_value * weight
+            shares_value = portfolio_value * weight
             new_quantity = 0
             if last_price > 0:
                 new_quantity = shares_value / last_price
@@ -143,28 +189,24 @@ class CustomETF(Strategy):
                         quote=quote,
                     )
                     orders.append(order)
+                    prices[symbol] = last_price
 
         if len(orders) == 0:
             self.log_message("No orders to execute")
 
         # First sell any assets that are not in the portfolio
-        positions = self.get_positions()
-        for position in positions:
-            if position.asset not in [
-                obj["asset"] for obj in self.parameters["portfolio"]
-            ]:
-                # Check if it's the quote asset
-                if position.asset == self.quote_asset:
-                    continue
-
-                if position.quantity > 0:
-                    order = self.create_order(position.asset, position.quantity, "sell")
+        # (the ledger leaves the quote asset out of the positions)
+        portfolio_symbols = [obj["asset"].symbol for obj in self.parameters["portfolio"]]
+        for symbol, quantity in list(self.ledger.positions.items()):
+            if symbol not in portfolio_symbols:
+                if quantity > 0:
+                    order = self.create_order(self.ledger.assets[symbol], quantity, "sell")
                     if not hasattr(order, "quantity") or order.quantity is None:
                         self.log_message(
-                            f"Couldn't create a sell order for {position.asset.symbol} because order.quantity is None"
+                            f"Couldn't create a sell order for {symbol} because order.quantity is None"
                         )
                         continue
-                    self.submit_order(order)
+                    self.ledger.submit(order)
 
         # Sleep for 5 seconds to make sure the sell orders are filled
         self.sleep(5)
@@ -172,7 +214,7 @@ class CustomETF(Strategy):
         # Execute sell orders first so that we have the cash to buy the new shares
         for order in orders:
             if order.side == "sell":
-                self.submit_order(order)
+                self.ledger.submit(order, prices[order.asset.symbol])
 
         # Sleep for 5 seconds to make sure the sell orders are filled
         self.sleep(5)
@@ -180,7 +222,7 @@ class CustomETF(Strategy):
         # Execute buy orders
         for order in orders:
             if order.side == "buy":
-                self.submit_order(order)
+                self.ledger.submit(order, prices[order.asset.symbol])
 
                 # TODO: Will this work better for Alpaca?
                 # self.safe_sleep(5)
@@ -196,9 +238,12 @@ if __name__ == "__main__":
         # Run the strategy live
         ############################################
 
+        from lumibot.traders import Trader
+
         from config import (
             broker,
         )
+        from queue_logging import install_queue_logging
 
         trader = Trader()
         strategy = CustomETF(
@@ -209,6 +254,12 @@ if __name__ == "__main__":
         "**IMPORTANT:** Access to this algorithm is not automatic. If you get a 404 Error then please contact <@479785401209323535> for us to give you access. Also, make sure you are logged into GitHub.",
             )
         trader.add_strategy(strategy)
+
+        # Write the logs from a background thread, keep 1 in 10 of the per-cycle messages
+        install_queue_logging(
+            "crypto_custom_etf.log",
+            sampling={"Waiting for next rebalance": 10},
+        )
         trader.run_all()
 
     else:
@@ -216,6 +267,7 @@ if __name__ == "__main__":
         # Backtest the strategy
         ####
         from lumibot.backtesting import PolygonDataBacktesting
+        from lumibot.entities import TradingFee
 
         from config import POLYGON_CONFIG
 
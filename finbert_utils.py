@@ -1,19 +1,26 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
 from typing import Tuple 
+
+from profiling import profiled
+
 device = "cuda:0" if torch.cuda.is_available() else "cpu"
 
 tokenizer = AutoTokenizer.from_pretrained("ProsusAI/finbert")
 model = AutoModelForSequenceClassification.from_pretrained("ProsusAI/finbert").to(device)
 labels = ["positive", "negative", "neutral"]
 
+def _logits(headlines):
+    """FinBERT logits of every headline, one row per headline, from a single padded batch"""
+    tokens = tokenizer(headlines, return_tensors="pt", padding=True, truncation=True).to(device)
+    with torch.no_grad():
+        return model(tokens["input_ids"], attention_mask=tokens["attention_mask"])["logits"]
+
+
+@profiled()
 def estimate_sentiment(news):
     if news:
-        tokens = tokenizer(news, return_tensors="pt", padding=True).to(device)
-
-        result = model(tokens["input_ids"], attention_mask=tokens["attention_mask"])[
-            "logits"
-        ]
+        result = _logits(news)
         result = torch.nn.functional.softmax(torch.sum(result, 0), dim=-1)
         probability = result[torch.argmax(result)]
         sentiment = labels[torch.argmax(result)]
@@ -22,6 +29,46 @@ def estimate_sentiment(news):
         return 0, labels[-1]
 
 
+@profiled()
+def score_headlines(headlines):
+    """Score every headline on its own, all in one padded batch
+
+    Returns a (probability, sentiment) tuple per headline.
+    """
+    if not headlines:
+        return []
+
+    result = _logits(headlines)
+    probabilities, indices = torch.max(torch.nn.functional.softmax(result, dim=-1), dim=-1)
+    return [(probability, labels[index]) for probability, index in zip(probabilities.tolist(), indices.tolist())]
+
+
+@profiled()
+def estimate_sentiment_batch(news_by_symbol):
+    """estimate_sentiment for many symbols with one forward pass
+
+    Every distinct headline is scored once in a single padded batch, then the logits of the headlines of each
+    symbol are summed like in estimate_sentiment. Returns {symbol: (probability, sentiment)}.
+    """
+    headlines = list(dict.fromkeys(headline for news in news_by_symbol.values() for headline in news))
+    if not headlines:
+        return {symbol: (0, labels[-1]) for symbol in news_by_symbol}
+
+    result = _logits(headlines)
+    rows = {headline: i for i, headline in enumerate(headlines)}
+
+    sentiments = {}
+    for symbol, news in news_by_symbol.items():
+        if not news:
+            sentiments[symbol] = (0, labels[-1])
+            continue
+        logits = torch.sum(result[[rows[headline] for headline in news]], 0)
+        probabilities = torch.nn.functional.softmax(logits, dim=-1)
+        index = int(torch.argmax(probabilities))
+        sentiments[symbol] = (float(probabilities[index]), labels[index])
+    return sentiments
+
+
 if __name__ == "__main__":
     tensor, sentiment = estimate_sentiment(['markets responded negatively to the news!','traders were displeased!'])
     print(tensor, sentiment)
@@ -0,0 +1,170 @@
+import argparse
+import compileall
+import fnmatch
+import os
+import py_compile
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+"""
+Lambda Layer Build and Cold Start Benchmark
+
+build: installs requirements.txt and lumibot into build/python (wheels for the Lambda runtime: CPython 3.12 on
+       manylinux x86_64, whatever Python runs the build), removes everything matched by lambda_layer_manifest.txt,
+       optionally precompiles the bytecode (keeping the .py sources unless --drop-sources) and zips the result to
+       lumibot_layer.zip.
+       --compile must run on Python 3.12: the .pyc files only load on the version that wrote them.
+
+bench: imports lambda_handler and a strategy in a fresh interpreter with "python -X importtime" and reports
+       the import time per top level module, slowest first.
+
+Examples:
+    python3 lambda_build.py build --compile
+    python3 lambda_build.py bench --strategy CustomETF
+
+"""
+
+BUILD_DIR = "build"
+MANIFEST_FILE = "lambda_layer_manifest.txt"
+LAYER_FILE = "lumibot_layer"
+
+# Packages the strategies import that aren't in requirements.txt (the EC2 bots don't need them)
+LAYER_PACKAGES = ["lumibot"]
+
+# Runtime the layer is published for
+LAMBDA_PYTHON_VERSION = (3, 12)
+LAMBDA_PLATFORM = "manylinux2014_x86_64"
+
+
+def read_manifest(path=MANIFEST_FILE):
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def prune(root, patterns):
+    """Remove every file and folder under root that matches one of the patterns"""
+    removed = 0
+    for folder, dirs, files in os.walk(root, topdown=True):
+        relative_folder = os.path.relpath(folder, root)
+        for name in list(dirs) + files:
+            relative_path = os.path.normpath(os.path.join(relative_folder, name)).replace(os.sep, "/")
+            if not any(fnmatch.fnmatch(relative_path, pattern) for pattern in patterns):
+                continue
+
+            path = os.path.join(folder, name)
+            if name in dirs:
+                shutil.rmtree(path)
+                dirs.remove(name)
+            else:
+                os.remove(path)
+            removed += 1
+    return removed
+
+
+def precompile(root, optimize=0, drop_sources=False):
+    """Compile every module ahead of time, so nothing is compiled at cold start
+
+    The sources are kept (inspect.getsource and tracebacks need them) and the bytecode goes to __pycache__ as
+    unchecked hash based .pyc files, loaded without comparing them to the sources. drop_sources writes the .pyc next
+    to the sources instead and removes them, for a smaller layer. optimize 1 drops the asserts and 2 the docstrings
+    too, which some packages rely on: the runtime only loads such bytecode without the sources (or with
+    PYTHONOPTIMIZE set), so keep the default 0 unless the layer's packages are known to work without them.
+    """
+    if not drop_sources:
+        compileall.compile_dir(
+            root, quiet=1, optimize=optimize, workers=0, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+        )
+        return
+
+    compileall.compile_dir(root, quiet=1, legacy=True, optimize=optimize, workers=0)
+    for folder, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(".py") and os.path.exists(os.path.join(folder, name + "c")):
+                os.remove(os.path.join(folder, name))
+
+
+def build(compile_bytecode=False, optimize=0, drop_sources=False):
+    if compile_bytecode and sys.version_info[:2] != LAMBDA_PYTHON_VERSION:
+        raise SystemExit(
+            f"--compile needs Python {'.'.join(map(str, LAMBDA_PYTHON_VERSION))} (the Lambda runtime), "
+            f"this is {sys.version_info.major}.{sys.version_info.minor}"
+        )
+
+    target = os.path.join(BUILD_DIR, "python")
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    os.makedirs(target)
+
+    subprocess.run(
+        [
+            sys.executable, "-m", "pip", "install",
+            "-r", "requirements.txt", *LAYER_PACKAGES,
+            "--target", target,
+            "--only-binary=:all:",
+            "--implementation", "cp",
+            "--python-version", ".".join(map(str, LAMBDA_PYTHON_VERSION)),
+            "--platform", LAMBDA_PLATFORM,
+        ],
+        check=True,
+    )
+
+    removed = prune(target, read_manifest())
+    print(f"Pruned {removed} files and folders")
+
+    if compile_bytecode:
+        precompile(target, optimize, drop_sources)
+
+    archive = shutil.make_archive(LAYER_FILE, "zip", BUILD_DIR, "python")
+    print(f"Layer written to {archive} ({os.path.getsize(archive) / 1e6:.1f} MB)")
+
+
+def bench(strategy):
+    code = f"import lambda_handler; lambda_handler.load_strategy({strategy!r})"
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(result.returncode)
+
+    # Lines look like "import time:       123 |       4567 |   package.module"
+    self_times = {}
+    for match in re.finditer(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", result.stderr):
+        top_level = match.group(4).split(".")[0]
+        self_times[top_level] = self_times.get(top_level, 0) + int(match.group(1))
+
+    total = sum(self_times.values())
+    print(f"Cold start import of {strategy}: {total / 1e6:.3f}s of imports, {elapsed:.3f}s process wall time")
+    print(f"{'module':30} {'seconds':>8} {'share':>7}")
+    for module, micros in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:30]:
+        print(f"{module:30} {micros / 1e6:8.3f} {micros / total:7.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--compile", action="store_true", help="precompile the bytecode")
+    build_parser.add_argument(
+        "--optimize", type=int, choices=(0, 1, 2), default=0, help="optimization level of the precompiled bytecode"
+    )
+    build_parser.add_argument("--drop-sources", action="store_true", help="keep only the precompiled bytecode")
+
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--strategy", default="StockTopETFPicker")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.compile, args.optimize, args.drop_sources)
+    else:
+        bench(args.strategy)
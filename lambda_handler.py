@@ -0,0 +1,76 @@
+import importlib
+import os
+import time
+
+"""
+AWS Lambda Entry Point
+
+Runs a single on_trading_iteration of a strategy per invocation, e.g. from an EventBridge schedule.
+Only this file and config.py are imported at cold start; the strategy module (and lumibot with it) is
+imported on the first invocation that needs it, and the strategy instance is kept for warm invocations.
+
+Event:
+    {"strategy": "StockTopETFPicker", "parameters": {...}}
+
+"""
+
+# Only /tmp is writable on Lambda
+os.environ.setdefault("CHECKPOINT_DIR", "/tmp/checkpoints")
+os.environ.setdefault("SYMBOL_INDEX_FILE", "/tmp/symbol_index.json")
+
+# Strategy class name -> module that defines it
+STRATEGIES = {
+    "CustomETF": "crypto_custom_etf",
+    "StockTopETFPicker": "stock_top_etf_picker",
+}
+
+# Strategies created by previous (warm) invocations
+_strategies = {}
+
+
+def load_strategy(name):
+    """Import the module of a strategy and return the strategy class"""
+    module = importlib.import_module(STRATEGIES[name])
+    return getattr(module, name)
+
+
+def get_strategy(name, parameters):
+    key = (name, repr(sorted(parameters.items())))
+    if key in _strategies:
+        return _strategies[key]
+
+    from config import get_broker
+
+    strategy_class = load_strategy(name)
+
+    # The ETF picker needs its universe when none is given
+    if name == "StockTopETFPicker" and not parameters.get("symbols"):
+        parameters = dict(parameters, symbols=importlib.import_module(STRATEGIES[name]).fetch_tickers())
+
+    strategy = strategy_class(broker=get_broker(), name=name, parameters=parameters)
+    strategy.initialize()
+
+    _strategies[key] = strategy
+    return strategy
+
+
+def lambda_handler(event, context):
+    start = time.perf_counter()
+
+    name = event.get("strategy", "StockTopETFPicker")
+    parameters = event.get("parameters", {})
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {name}, expected one of {list(STRATEGIES)}")
+
+    cold_start = not _strategies
+    strategy = get_strategy(name, parameters)
+    setup_time = time.perf_counter() - start
+
+    strategy.on_trading_iteration()
+
+    return {
+        "strategy": name,
+        "cold_start": cold_start,
+        "setup_seconds": round(setup_time, 3),
+        "total_seconds": round(time.perf_counter() - start, 3),
+    }
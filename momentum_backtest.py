@@ -0,0 +1,266 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from momentum_signals import MomentumSignals
+
+"""
+Fast Momentum Backtest
+
+A vectorized backtest of the StockTopETFPicker rules, computed from one aligned price matrix (date x symbol)
+instead of lumibot's day by day event simulation:
+
+- momentum is the total return over the last analysis_period bars (first to last close in the window), or a blend
+  of several lookbacks, from the prefix sums of momentum_signals.py
+- a symbol needs at least 4.5/7 of analysis_period (or the longest lookback) bars in the window (64% coverage check)
+- symbols priced under $1 are skipped
+- the top N symbols by momentum are held, everything else is sold
+- positions are topped up or trimmed only when the change is more than rebalance_threshold of the portfolio
+- every trade pays a percent fee (0.1% by default, like the TradingFee of the event-driven backtest)
+
+The signals (momentum, coverage, price filter and ranking) are computed for every day at once with array
+operations; only the order logic, which depends on the cash left after the previous order, walks through
+the top N symbols of each day.
+
+Model assumptions: the analysis window of a day ends at the previous bar, and orders fill at that day's price.
+
+Examples:
+    python3 momentum_backtest.py              # full backtest, saved to the backtest store
+    python3 momentum_backtest.py --check      # compare with the lumibot backtest on a short window
+
+"""
+
+
+def run_fast_backtest(
+    prices,
+    backtesting_start,
+    backtesting_end=None,
+    number_of_symbols=5,
+    analysis_period=1500,
+    rebalance_threshold=0.08,
+    percent_fee=0.001,
+    budget=100000,
+    lookbacks=None,
+    signals=None,
+):
+    """Backtest the top N momentum strategy on a price matrix
+
+    prices is a DataFrame indexed by date with one column per symbol (NaN before a symbol is listed),
+    starting at least analysis_period bars before backtesting_start.
+    lookbacks optionally ranks on a weighted blend of lookbacks ({200: 0.5, 1500: 0.5}) instead of analysis_period,
+    and signals is a MomentumSignals of the prices to reuse across runs.
+    Returns a dict with the daily "equity" Series and the "trades" DataFrame.
+    """
+    symbols = np.asarray(prices.columns)
+    close = prices.to_numpy(dtype=np.float64)
+    n_rows, n_symbols = close.shape
+    row_index = np.arange(n_rows)[:, None]
+    cols = np.arange(n_symbols)
+
+    # Rows of the trading days to simulate
+    dates = prices.index
+    in_range = dates >= pd.Timestamp(backtesting_start)
+    if backtesting_end is not None:
+        in_range &= dates <= pd.Timestamp(backtesting_end)
+    rows = np.flatnonzero(in_range)
+    rows = rows[rows > 0]
+
+    # Momentum of every day from the prefix sums, a single lookback unless a blend is given
+    if signals is None:
+        signals = MomentumSignals(prices)
+    if lookbacks is None:
+        lookbacks = {analysis_period: 1}
+    blended, bars = signals.blend(lookbacks)
+    momentum = blended[rows]
+    bars = bars[rows]
+    has_data = bars > 0
+    coverage_period = max(lookbacks)
+
+    last_valid = np.maximum.accumulate(np.where(~np.isnan(close), row_index, -1), axis=0)
+
+    # Prices the orders fill at (the last known price for symbols without a bar that day)
+    marks = close[np.maximum(last_valid[rows], 0), cols]
+    marks[last_valid[rows] < 0] = np.nan
+    day_prices = close[rows]
+
+    # Coverage check, no penny stocks
+    eligible = has_data & (bars >= 4.5 / 7 * coverage_period) & (day_prices >= 1) & np.isfinite(momentum)
+
+    # Rank all the days at once
+    scores = np.where(eligible, momentum, -np.inf)
+    ranking = np.argsort(-scores, axis=1, kind="stable")[:, :number_of_symbols]
+    ranking_eligible = np.take_along_axis(eligible, ranking, axis=1)
+
+    quantity = np.zeros(n_symbols)
+    cash = float(budget)
+    equity = np.empty(len(rows))
+    trades = []
+
+    for k, t in enumerate(rows):
+        mark = marks[k]
+        held_value = np.nansum(quantity * mark)
+        portfolio_value = cash + held_value
+
+        top_symbols = ranking[k][ranking_eligible[k]]
+        held = quantity != 0
+
+        # Sell the positions that are not in the top N (if we own at least one share)
+        in_top = np.zeros(n_symbols, dtype=bool)
+        in_top[top_symbols] = True
+        to_sell = np.flatnonzero(held & ~in_top & (quantity >= 1) & ~np.isnan(mark))
+        for s in to_sell:
+            value = quantity[s] * mark[s]
+            cash += value * (1 - percent_fee)
+            trades.append((t, s, "sell", quantity[s], mark[s], value * percent_fee))
+            quantity[s] = 0
+
+        # Buy or rebalance the top N
+        amount_to_spend = portfolio_value / number_of_symbols
+        for s in top_symbols:
+            price = mark[s]
+            quantity_should_own = amount_to_spend // price
+
+            if not held[s]:
+                if quantity_should_own >= 1 and cash >= amount_to_spend:
+                    value = quantity_should_own * price
+                    cash -= value * (1 + percent_fee)
+                    quantity[s] = quantity_should_own
+                    trades.append((t, s, "buy", quantity_should_own, price, value * percent_fee))
+                continue
+
+            current = quantity[s]
+            if current < quantity_should_own and cash >= amount_to_spend:
+                quantity_to_buy = quantity_should_own - current
+                value = quantity_to_buy * price
+                if value / portfolio_value > rebalance_threshold:
+                    cash -= value * (1 + percent_fee)
+                    quantity[s] = quantity_should_own
+                    trades.append((t, s, "buy", quantity_to_buy, price, value * percent_fee))
+
+            elif current > quantity_should_own:
+                quantity_to_sell = current - quantity_should_own
+                value = quantity_to_sell * price
+                if value / portfolio_value > rebalance_threshold:
+                    cash += value * (1 - percent_fee)
+                    quantity[s] = quantity_should_own
+                    trades.append((t, s, "sell", quantity_to_sell, price, value * percent_fee))
+
+        equity[k] = cash + np.nansum(quantity * mark)
+
+    trades_df = pd.DataFrame(trades, columns=["row", "symbol", "side", "filled_quantity", "price", "trade_cost"])
+    trades_df.insert(0, "datetime", dates[trades_df.pop("row").to_numpy(dtype=np.int64)])
+    trades_df["symbol"] = symbols[trades_df["symbol"].to_numpy(dtype=np.int64)]
+
+    return {
+        "equity": pd.Series(equity, index=dates[rows], name="portfolio_value"),
+        "trades": trades_df,
+    }
+
+
+def compare_equity(fast_equity, event_equity):
+    """Compare two equity curves on their common days
+
+    Returns the largest relative difference between the daily values and the relative difference of the final values.
+    """
+    event_daily = event_equity.copy()
+    event_daily.index = pd.DatetimeIndex(event_daily.index).tz_localize(None).normalize()
+    event_daily = event_daily.groupby(level=0).last()
+
+    common = fast_equity.index.intersection(event_daily.index)
+    fast = fast_equity.loc[common]
+    event = event_daily.loc[common]
+    relative = (fast - event).abs() / event
+    return {
+        "days": len(common),
+        "max_relative_difference": float(relative.max()),
+        "final_relative_difference": float(relative.iloc[-1]),
+    }
+
+
+def run_event_driven(tickers, backtesting_start, backtesting_end, analysis_period):
+    """Run the lumibot backtest of StockTopETFPicker and return its equity curve"""
+    from lumibot.backtesting import YahooDataBacktesting
+    from lumibot.entities import TradingFee
+
+    from stock_top_etf_picker import StockTopETFPicker
+
+    trading_fee = TradingFee(percent_fee=0.001)
+    _, strategy = StockTopETFPicker.run_backtest(
+        YahooDataBacktesting,
+        backtesting_start,
+        backtesting_end,
+        benchmark_asset="SPY",
+        buy_trading_fees=[trading_fee],
+        sell_trading_fees=[trading_fee],
+        parameters={
+            "symbols": tickers,
+            "analysis_period": analysis_period,
+        },
+        show_plot=False,
+        show_tearsheet=False,
+        save_tearsheet=False,
+    )
+    return strategy._strategy_returns_df["portfolio_value"]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from backtest_store import BacktestStore
+    from price_data import load_price_matrix
+    from symbol_universe import universe_symbols
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="compare with the event-driven backtest")
+    parser.add_argument("--days", type=int, nargs="+", default=[1500], help="analysis periods to backtest")
+    args = parser.parse_args()
+
+    tickers = universe_symbols()
+
+    if args.check:
+        ####
+        # Consistency check against lumibot on a short window
+        ####
+        backtesting_start = datetime(2023, 1, 1)
+        backtesting_end = datetime(2023, 6, 30)
+        analysis_period = args.days[0]
+
+        prices = load_price_matrix(tickers, backtesting_start, backtesting_end, warmup_days=analysis_period * 2)
+        fast = run_fast_backtest(prices, backtesting_start, backtesting_end, analysis_period=analysis_period)
+        event = run_event_driven(tickers, backtesting_start, backtesting_end, analysis_period)
+        print(compare_equity(fast["equity"], event))
+
+    else:
+        ####
+        # Full backtest for every analysis period
+        ####
+        backtesting_start = datetime(2011, 1, 1)
+        backtesting_end = datetime(2024, 6, 26)
+
+        prices = load_price_matrix(tickers, backtesting_start, backtesting_end, warmup_days=max(args.days) * 2)
+        signals = MomentumSignals(prices)
+        store = BacktestStore()
+
+        for days in args.days:
+            start = time.perf_counter()
+            result = run_fast_backtest(
+                prices, backtesting_start, backtesting_end, analysis_period=days, signals=signals
+            )
+            elapsed = time.perf_counter() - start
+
+            print(f"{days} days: {len(result['trades'])} trades, final value {result['equity'].iloc[-1]:,.2f} ({elapsed:.3f}s)")
+            store.save_run(
+                "StockTopETFPicker-fast",
+                {
+                    "symbols": tickers,
+                    "analysis_period": days,
+                    "backtesting_start": backtesting_start,
+                    "backtesting_end": backtesting_end,
+                },
+                result["equity"],
+                trades=result["trades"],
+            )
+
+        print(store.summary().sort_values("cagr", ascending=False))
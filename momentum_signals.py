@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+"""
+Momentum Signals
+
+Momentum over any lookback, for every date and symbol, from one pass over the price history.
+
+The cumulative sum of the daily log returns of every symbol is built once. The total return over a window is then
+the difference of two prefix sums, so the momentum of any lookback on any date costs O(1), and comparing or
+blending lookbacks (50 to 2500 days) needs no extra data.
+
+The window of row t covers the bars [t - lookback, t), i.e. it ends at the previous bar like the strategy's
+historical prices. Within the window the return is measured from the first to the last available close, so a
+symbol listed inside the window is measured from its listing, and the number of bars is returned for the
+coverage check.
+
+"""
+
+
+class MomentumSignals:
+    def __init__(self, prices):
+        """prices is a DataFrame of closes indexed by date with one column per symbol (NaN where missing)"""
+        self.dates = prices.index
+        self.symbols = list(prices.columns)
+        close = prices.to_numpy(dtype=np.float64)
+        n_rows, n_symbols = close.shape
+        row_index = np.arange(n_rows)[:, None]
+        cols = np.arange(n_symbols)
+
+        valid = ~np.isnan(close)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_close = np.log(close)
+
+        # Cumulative log return up to each row (flat over missing bars, 0 before the listing)
+        last_valid = np.maximum.accumulate(np.where(valid, row_index, -1), axis=0)
+        previous_log_close = np.where(last_valid >= 0, log_close[np.maximum(last_valid, 0), cols], np.nan)
+        log_returns = np.diff(previous_log_close, axis=0, prepend=np.nan)
+        self.prefix = np.nancumsum(log_returns, axis=0)
+
+        # Prefix sum at the first valid bar at or after each row, where a window starting on that row starts
+        next_valid = np.minimum.accumulate(np.where(valid, row_index, n_rows)[::-1], axis=0)[::-1]
+        self.window_start_prefix = np.where(
+            next_valid < n_rows, self.prefix[np.minimum(next_valid, n_rows - 1), cols], np.nan
+        )
+
+        # Number of valid bars before each row
+        self.counts = np.vstack([np.zeros((1, n_symbols), dtype=np.int64), np.cumsum(valid, axis=0)])
+
+        # lookback -> (log momentum, bars) for every row, computed on first use
+        self._cache = {}
+
+    # =============Single values===================
+
+    def value(self, row, symbol, lookback):
+        """Total return of a symbol over the lookback bars before a row (len(dates) for after the last bar)"""
+        s = self.symbols.index(symbol) if not isinstance(symbol, (int, np.integer)) else symbol
+        if row <= 0:
+            return np.nan
+        start = max(row - lookback, 0)
+        if self.counts[row, s] - self.counts[start, s] == 0:
+            return np.nan
+        return float(np.exp(self.prefix[row - 1, s] - self.window_start_prefix[start, s]))
+
+    def bars(self, row, symbol, lookback):
+        s = self.symbols.index(symbol) if not isinstance(symbol, (int, np.integer)) else symbol
+        return int(self.counts[row, s] - self.counts[max(row - lookback, 0), s])
+
+    # =============Whole matrices===================
+
+    def log_momentum(self, lookback):
+        """Log total return and bar count over the lookback, for the rows 0..len(dates)
+
+        The extra last row is the signal after the last bar, i.e. for the next trading day.
+        """
+        if lookback not in self._cache:
+            n_rows = len(self.dates)
+            rows = np.arange(n_rows + 1)
+            start = np.maximum(rows - lookback, 0)
+            bars = self.counts[rows] - self.counts[start]
+
+            end_prefix = np.full((n_rows + 1, len(self.symbols)), np.nan)
+            end_prefix[1:] = self.prefix
+            start_prefix = self.window_start_prefix[np.minimum(start, max(n_rows - 1, 0))]
+            log_return = np.where(bars > 0, end_prefix - start_prefix, np.nan)
+            self._cache[lookback] = (log_return, bars)
+        return self._cache[lookback]
+
+    def momentum(self, lookback):
+        """Total return over the lookback for every date and symbol"""
+        log_return, _ = self.log_momentum(lookback)
+        return pd.DataFrame(np.exp(log_return[:-1]), index=self.dates, columns=self.symbols)
+
+    def tensor(self, lookbacks):
+        """Total returns as a (date x symbol x lookback) array"""
+        return np.stack([np.exp(self.log_momentum(lookback)[0][:-1]) for lookback in lookbacks], axis=-1)
+
+    def blend(self, weights):
+        """Weighted blend of lookbacks, e.g. {200: 0.5, 1500: 0.5}
+
+        Returns the blended total return (the weighted geometric mean of the returns of each lookback) and the
+        bar count of the longest lookback, for the rows 0..len(dates).
+        """
+        total_weight = sum(weights.values())
+        blended = None
+        for lookback, weight in weights.items():
+            log_return, _ = self.log_momentum(lookback)
+            part = log_return * (weight / total_weight)
+            blended = part if blended is None else blended + part
+        _, bars = self.log_momentum(max(weights))
+        return np.exp(blended), bars
+
+    def latest(self, weights):
+        """Blended total return and bar count of every symbol after the last bar"""
+        blended, bars = self.blend(weights)
+        return pd.DataFrame({"total_return": blended[-1], "bars": bars[-1]}, index=self.symbols)
@@ -0,0 +1,402 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+"""
+News to Signal Pipeline
+
+An asyncio pipeline that turns a stream of news into trading signals for many symbols at once, instead of
+pulling news for one symbol once a day inside on_trading_iteration:
+
+    source -> dedupe -> FinBERT scoring (batched, on a worker pool) -> per-symbol rolling sentiment -> signals
+
+- sources: AlpacaNewsSource polls the news API, AlpacaNewsStreamSource listens to the news websocket and
+  StubNewsSource replays a fixed list of headlines locally
+- dedupe drops news already seen (by id, or by headline when there is no id)
+- scoring collects headlines into batches (up to batch_size, or whatever arrived within max_batch_wait seconds)
+  and scores every batch in one forward pass on a thread pool, so the event loop keeps ingesting meanwhile
+- every symbol keeps the scores of the last window seconds; positive news counts as +probability, negative
+  as -probability and neutral as 0
+- a signal is emitted when the average score of a symbol crosses threshold with at least min_count news,
+  then the symbol is quiet for cooldown seconds
+
+Every stage reports how many items it processed, its queue depth and its latency (from when the news was
+received) through metrics(). A batch the scorer fails on is logged and counted as failed_batches.
+
+Signals go to on_signal when it is set. Otherwise they are put on the pipeline.signals queue, which the caller
+must drain: it holds at most queue_size signals and the oldest are dropped when it is full.
+
+Example:
+    python3 news_pipeline.py --stub
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class NewsItem:
+    __slots__ = ("id", "headline", "symbols", "created_at", "received_at", "probability", "sentiment")
+
+    def __init__(self, id, headline, symbols, created_at=None):
+        self.id = id
+        self.headline = headline
+        self.symbols = symbols
+        self.created_at = created_at
+        self.received_at = time.monotonic()
+        self.probability = None
+        self.sentiment = None
+
+
+class Signal:
+    __slots__ = ("symbol", "side", "score", "count", "created_at")
+
+    def __init__(self, symbol, side, score, count):
+        self.symbol = symbol
+        self.side = side
+        self.score = score
+        self.count = count
+        self.created_at = datetime.now(timezone.utc)
+
+    def __repr__(self):
+        return f"Signal({self.symbol} {self.side} score={self.score:.3f} news={self.count})"
+
+
+class StageMetrics:
+    def __init__(self, queue=None):
+        self.queue = queue
+        self.processed = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def observe(self, item):
+        latency = time.monotonic() - item.received_at
+        self.processed += 1
+
+        # Exponentially weighted average latency
+        self.latency = latency if self.processed == 1 else 0.9 * self.latency + 0.1 * latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "latency": round(self.latency, 4),
+            "max_latency": round(self.max_latency, 4),
+        }
+
+
+# =============Sources===================
+
+
+class StubNewsSource:
+    """Local source replaying a list of (headline, symbols) every interval seconds"""
+
+    def __init__(self, news, interval=0.0):
+        self.news = news
+        self.interval = interval
+
+    async def stream(self):
+        for i, (headline, symbols) in enumerate(self.news):
+            yield NewsItem(f"stub-{i}", headline, symbols)
+            await asyncio.sleep(self.interval)
+
+
+class AlpacaNewsSource:
+    """Poll the Alpaca news API for a list of symbols"""
+
+    def __init__(self, symbols, poll_interval=60, lookback=timedelta(hours=1)):
+        import config
+        from alpaca_trade_api import REST
+
+        self.api = REST(base_url=config.ENDPOINT, key_id=config.API_KEY, secret_key=config.API_SECRET)
+        self.symbols = symbols
+        self.poll_interval = poll_interval
+        self.lookback = lookback
+
+    async def stream(self):
+        loop = asyncio.get_running_loop()
+        start = datetime.now(timezone.utc) - self.lookback
+        while True:
+            end = datetime.now(timezone.utc)
+            news = await loop.run_in_executor(
+                None,
+                lambda: self.api.get_news(symbol=self.symbols, start=start.isoformat(), end=end.isoformat(), limit=50),
+            )
+            for article in news:
+                raw = article._raw
+                yield NewsItem(raw.get("id"), raw["headline"], raw.get("symbols", []), raw.get("created_at"))
+            start = end
+            await asyncio.sleep(self.poll_interval)
+
+
+class AlpacaNewsStreamSource:
+    """Listen to the Alpaca news websocket (run in its own thread) for a list of symbols"""
+
+    def __init__(self, symbols):
+        import config
+        from alpaca.data.live import NewsDataStream
+
+        self.stream_client = NewsDataStream(config.API_KEY, config.API_SECRET)
+        self.symbols = symbols
+
+    async def stream(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def on_news(news):
+            item = NewsItem(news.id, news.headline, news.symbols, news.created_at)
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        self.stream_client.subscribe_news(on_news, *self.symbols)
+        threading.Thread(target=self.stream_client.run, daemon=True).start()
+        while True:
+            yield await queue.get()
+
+
+# =============Pipeline===================
+
+
+def signed_score(probability, sentiment):
+    if sentiment == "positive":
+        return probability
+    if sentiment == "negative":
+        return -probability
+    return 0.0
+
+
+class NewsPipeline:
+    def __init__(
+        self,
+        source,
+        scorer=None,
+        batch_size=32,
+        max_batch_wait=0.5,
+        workers=1,
+        window=3600,
+        threshold=0.5,
+        min_count=3,
+        cooldown=900,
+        queue_size=10000,
+        on_signal=None,
+    ):
+        self.source = source
+
+        # Scores a list of headlines, finbert_utils.score_headlines by default (imported when first needed)
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finbert")
+
+        self.window = window
+        self.threshold = threshold
+        self.min_count = min_count
+        self.cooldown = cooldown
+        self.on_signal = on_signal
+
+        self.dedupe_queue = asyncio.Queue(queue_size)
+        self.score_queue = asyncio.Queue(queue_size)
+        self.aggregate_queue = asyncio.Queue(queue_size)
+        # Only used without on_signal, see the module docstring
+        self.signals = asyncio.Queue(queue_size)
+
+        self.stage_metrics = {
+            "ingest": StageMetrics(),
+            "dedupe": StageMetrics(self.dedupe_queue),
+            "score": StageMetrics(self.score_queue),
+            "aggregate": StageMetrics(self.aggregate_queue),
+            "signal": StageMetrics(self.signals),
+        }
+        self.duplicates = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+        # Keys of the news already seen, oldest first
+        self.seen = OrderedDict()
+        self.max_seen = 100000
+
+        # symbol -> deque of (time, score) and their running sum, and when the last signal of a symbol was emitted
+        self.scores = {}
+        self.score_sums = {}
+        self.last_signal = {}
+
+    async def run(self):
+        """Run all the stages until the source is exhausted and every queue is drained"""
+        if self.scorer is None:
+            from finbert_utils import score_headlines
+
+            self.scorer = score_headlines
+
+        stages = [
+            asyncio.create_task(self._dedupe()),
+            asyncio.create_task(self._score()),
+            asyncio.create_task(self._aggregate()),
+        ]
+        await self._ingest()
+
+        # Wait for the news in flight to go through every stage
+        for queue in (self.dedupe_queue, self.score_queue, self.aggregate_queue):
+            await queue.join()
+        for stage in stages:
+            stage.cancel()
+
+    def metrics(self):
+        metrics = {name: stage.as_dict() for name, stage in self.stage_metrics.items()}
+        metrics["dedupe"]["duplicates"] = self.duplicates
+        metrics["score"]["batches"] = self.batches
+        metrics["score"]["failed_batches"] = self.failed_batches
+        return metrics
+
+    def sentiment(self, symbol):
+        """Average score and number of news of a symbol over the window"""
+        scores = self.scores.get(symbol)
+        if not scores:
+            return 0.0, 0
+        return self.score_sums[symbol] / len(scores), len(scores)
+
+    # =============Stages===================
+
+    async def _ingest(self):
+        async for item in self.source.stream():
+            self.stage_metrics["ingest"].observe(item)
+            await self.dedupe_queue.put(item)
+
+    async def _dedupe(self):
+        while True:
+            item = await self.dedupe_queue.get()
+            key = item.id or hashlib.sha1(item.headline.strip().lower().encode("utf-8")).hexdigest()
+            if key in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen[key] = True
+                if len(self.seen) > self.max_seen:
+                    self.seen.popitem(last=False)
+                self.stage_metrics["dedupe"].observe(item)
+                await self.score_queue.put(item)
+            self.dedupe_queue.task_done()
+
+    async def _score(self):
+        loop = asyncio.get_running_loop()
+        running = asyncio.Semaphore(self.workers)
+        batch_tasks = set()
+
+        async def score_batch(batch):
+            try:
+                try:
+                    results = await loop.run_in_executor(self.executor, self.scorer, [item.headline for item in batch])
+                except Exception:
+                    # e.g. out of memory or a tokenizer error, the batch is dropped
+                    self.failed_batches += 1
+                    logger.exception(f"Scoring a batch of {len(batch)} headlines failed")
+                    return
+                for item, (probability, sentiment) in zip(batch, results):
+                    item.probability = probability
+                    item.sentiment = sentiment
+                    self.stage_metrics["score"].observe(item)
+                    await self.aggregate_queue.put(item)
+            finally:
+                for _ in batch:
+                    self.score_queue.task_done()
+                running.release()
+
+        while True:
+            # Wait for the first headline, then collect more until the batch is full or max_batch_wait passed
+            batch = [await self.score_queue.get()]
+            deadline = loop.time() + self.max_batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.score_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await running.acquire()
+            self.batches += 1
+            task = asyncio.create_task(score_batch(batch))
+
+            # Keep a reference to the task until it's done
+            batch_tasks.add(task)
+            task.add_done_callback(batch_tasks.discard)
+
+    async def _aggregate(self):
+        while True:
+            item = await self.aggregate_queue.get()
+            now = time.monotonic()
+            score = signed_score(item.probability, item.sentiment)
+
+            for symbol in item.symbols:
+                scores = self.scores.setdefault(symbol, deque())
+                scores.append((now, score))
+                self.score_sums[symbol] = self.score_sums.get(symbol, 0.0) + score
+
+                # Forget the scores older than the window
+                while scores and now - scores[0][0] > self.window:
+                    self.score_sums[symbol] -= scores.popleft()[1]
+
+                self._check_signal(symbol, now, item)
+
+            self.stage_metrics["aggregate"].observe(item)
+            self.aggregate_queue.task_done()
+
+    def _check_signal(self, symbol, now, item):
+        average, count = self.sentiment(symbol)
+        if count < self.min_count or abs(average) < self.threshold:
+            return
+        if now - self.last_signal.get(symbol, -self.cooldown) < self.cooldown:
+            return
+
+        self.last_signal[symbol] = now
+        signal = Signal(symbol, "buy" if average > 0 else "sell", average, count)
+        self.stage_metrics["signal"].observe(item)
+        if self.on_signal is not None:
+            self.on_signal(signal)
+            return
+
+        # Nobody drained the queue, drop the oldest signal
+        if self.signals.full():
+            self.signals.get_nowait()
+        self.signals.put_nowait(signal)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stub", action="store_true", help="use generated headlines and a keyword scorer")
+    parser.add_argument("symbols", nargs="*", default=["SPY", "AAPL", "MSFT", "NVDA", "TSLA"])
+    args = parser.parse_args()
+
+    if args.stub:
+        # Generated news for hundreds of symbols, scored by keywords instead of FinBERT
+        symbols = [f"SYM{i}" for i in range(300)]
+        words = ["surges", "beats estimates", "plunges", "misses estimates", "holds steady"]
+        news = [(f"{random.choice(symbols)} {random.choice(words)} {i}", None) for i in range(20000)]
+        news = [(headline, [headline.split()[0]]) for headline, _ in news]
+
+        def keyword_scorer(headlines):
+            results = []
+            for headline in headlines:
+                if "surges" in headline or "beats" in headline:
+                    results.append((0.95, "positive"))
+                elif "plunges" in headline or "misses" in headline:
+                    results.append((0.95, "negative"))
+                else:
+                    results.append((0.9, "neutral"))
+            return results
+
+        pipeline = NewsPipeline(StubNewsSource(news), scorer=keyword_scorer, threshold=0.3, on_signal=print)
+    else:
+        pipeline = NewsPipeline(AlpacaNewsSource(args.symbols), on_signal=print)
+
+    start = time.perf_counter()
+    asyncio.run(pipeline.run())
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+    print(pipeline.metrics())
@@ -0,0 +1,38 @@
+import hashlib
+import os
+from datetime import timedelta
+
+import pandas as pd
+
+"""
+Price Matrices
+
+Aligned daily price matrices (date x symbol) for the vectorized backtesters. All the symbols are downloaded from
+Yahoo Finance in a single request and cached as parquet, so a parameter sweep only downloads its data once.
+Symbols that didn't trade yet on a date have NaN prices.
+
+"""
+
+CACHE_DIR = "price_cache"
+
+
+def load_price_matrix(symbols, start, end, warmup_days=0, column="Close", cache_dir=CACHE_DIR):
+    """Return the daily prices of the symbols from warmup_days calendar days before start up to end"""
+    symbols = list(dict.fromkeys(symbols))
+    first_day = start - timedelta(days=warmup_days)
+
+    key = f"{','.join(symbols)}|{first_day:%Y-%m-%d}|{end:%Y-%m-%d}|{column}"
+    path = os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".parquet")
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    import yfinance as yf
+
+    df = yf.download(symbols, start=first_day, end=end, auto_adjust=False, progress=False, group_by="column")
+    prices = df[column].reindex(columns=symbols).astype("float64")
+    prices.index = pd.DatetimeIndex(prices.index).tz_localize(None)
+    prices = prices.dropna(how="all")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    prices.to_parquet(path)
+    return prices
@@ -0,0 +1,216 @@
+import functools
+import inspect
+import logging
+import os
+import signal
+import threading
+import time
+
+try:
+    import yappi
+except ImportError:
+    yappi = None
+
+"""
+On-Demand Profiling
+
+Profiles the next iterations of a running bot without restarting it. The functions decorated with @profiled
+(on_trading_iteration of the strategies, the FinBERT calls) cost one flag check while profiling is off.
+
+Turn it on with either:
+    kill -USR1 <pid>                       # profile the next 20 profiled calls
+    echo 5 > profiles/PROFILE              # profile the next 5 (the file is removed once read, empty means 20)
+
+Every profiled call is profiled with yappi on its own (all threads, coroutines attributed to their own
+functions) and written to profiles/ as:
+    <time>-<name>.callgrind    open with kcachegrind / qcachegrind
+    <time>-<name>.pstat        open with pstats or snakeviz
+    <time>-<name>.threads.txt  wall/cpu time and the time spent in every thread
+Calls made while another one is being profiled (e.g. estimate_sentiment inside on_trading_iteration, or a second
+strategy in the scheduler) are part of that profile instead of starting their own.
+
+The overhead stays bounded: a signal or control file arms max_iterations profiles, only the last max_profiles
+are kept on disk, and calls faster than min_seconds are not written at all. Without yappi installed
+(pip install yappi) everything is a no-op.
+
+"""
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    def __init__(
+        self,
+        folder=PROFILE_DIR,
+        control_file="PROFILE",
+        clock="wall",
+        max_iterations=20,
+        max_profiles=50,
+        min_seconds=0.0,
+        check_interval=5,
+    ):
+        self.folder = folder
+        self.control_file = os.path.join(folder, control_file)
+
+        # "wall" shows the time spent waiting on the network, "cpu" only the time spent computing
+        self.clock = clock
+        self.max_iterations = max_iterations
+        self.max_profiles = max_profiles
+        self.min_seconds = min_seconds
+
+        # Seconds between two checks of the control file
+        self.check_interval = check_interval
+        self.last_check = None
+
+        # Number of profiles left to take
+        self.remaining = 0
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return yappi is not None
+
+    def arm(self, iterations=None):
+        """Profile the next iterations profiled calls"""
+        self.remaining = iterations if iterations is not None else self.max_iterations
+        logger.info(f"Profiling the next {self.remaining} iterations to {self.folder}")
+
+    def toggle(self, *args):
+        """Signal handler: arm the profiler, or disarm it if it is armed"""
+        if self.remaining > 0:
+            self.remaining = 0
+            logger.info("Profiling stopped")
+        else:
+            self.arm()
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR1", None)):
+        # Signal handlers can only be set from the main thread (and SIGUSR1 doesn't exist on Windows)
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, self.toggle)
+        return True
+
+    def _check_control_file(self):
+        now = time.monotonic()
+        if self.last_check is not None and now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+
+        if not os.path.exists(self.control_file):
+            return
+        try:
+            with open(self.control_file) as f:
+                content = f.read().strip()
+            os.remove(self.control_file)
+        except OSError:
+            return
+        self.arm(int(content) if content.isdigit() else None)
+
+    def should_profile(self):
+        if yappi is None:
+            return False
+        self._check_control_file()
+        return self.remaining > 0
+
+    # =============Profiling===================
+
+    def profile(self, name, function, *args, **kwargs):
+        """Run function, profiled if the profiler is armed and not already profiling"""
+        if not self.should_profile() or not self.lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+
+        try:
+            self._start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._finish(name, time.perf_counter() - wall, time.process_time() - cpu)
+        finally:
+            self.lock.release()
+
+    async def profile_async(self, name, function, *args, **kwargs):
+        if not self.should_profile() or not self.lock.acquire(blocking=False):
+            return await function(*args, **kwargs)
+
+        try:
+            self._start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self._finish(name, time.perf_counter() - wall, time.process_time() - cpu)
+        finally:
+            self.lock.release()
+
+    def _start(self):
+        yappi.clear_stats()
+        yappi.set_clock_type(self.clock)
+        yappi.start(builtins=False, profile_threads=True)
+
+    def _finish(self, name, wall, cpu):
+        yappi.stop()
+        self.remaining -= 1
+
+        if wall >= self.min_seconds:
+            path = self._dump(name, wall, cpu)
+            logger.info(f"Profiled {name}: {wall:.3f}s wall, {cpu:.3f}s cpu, written to {path}.*")
+        yappi.clear_stats()
+
+        if self.remaining <= 0:
+            logger.info("Profiling done")
+
+    def _dump(self, name, wall, cpu):
+        os.makedirs(self.folder, exist_ok=True)
+        timestamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+        path = os.path.join(self.folder, f"{timestamp}-{name.replace('.', '_')}")
+
+        stats = yappi.get_func_stats()
+        stats.save(f"{path}.callgrind", type="callgrind")
+        stats.save(f"{path}.pstat", type="pstat")
+
+        with open(f"{path}.threads.txt", "w") as f:
+            f.write(f"{name}: {wall:.6f}s wall, {cpu:.6f}s cpu (process), clock {self.clock}\n\n")
+            yappi.get_thread_stats().print_all(out=f)
+
+        self._prune()
+        return path
+
+    def _prune(self):
+        # Every profile is a set of files sharing a prefix, keep the newest max_profiles
+        prefixes = sorted({filename.split(".")[0] for filename in os.listdir(self.folder) if "." in filename})
+        for prefix in prefixes[: -self.max_profiles]:
+            for suffix in (".callgrind", ".pstat", ".threads.txt"):
+                try:
+                    os.remove(os.path.join(self.folder, prefix + suffix))
+                except OSError:
+                    pass
+
+
+profiler = Profiler()
+profiler.install_signal_handler()
+
+
+def profiled(name=None):
+    """Decorator profiling every call of a function (sync or async) while the profiler is armed"""
+
+    def decorator(function):
+        profile_name = name or function.__qualname__
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                return await profiler.profile_async(profile_name, function, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return profiler.profile(profile_name, function, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+"""
+Non-Blocking Logging
+
+Moves all the log formatting and writing off the trading thread: the root logger gets a single handler that only
+puts the record on a queue, and a background listener thread formats the records and writes them to a size-rotated
+file (and to any handler that was already installed, e.g. lumibot's console handler).
+
+- records are written as compact JSON lines; pass structured fields with extra={"fields": {...}} instead of
+  formatting whole DataFrames into the message
+- verbose messages can be sampled: SamplingFilter keeps 1 in N records containing a given text (or of any record
+  logged with extra={"sample_every": N}) before they are even queued
+
+Usage:
+    from queue_logging import install_queue_logging
+    install_queue_logging("tradingapp.log", sampling={"Waiting for next rebalance": 10})
+
+"""
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line with the time, level, logger, message and structured fields"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only 1 in N records of verbose messages
+
+    rules maps a text to N, it applies to every message containing the text (lumibot prefixes the messages). A record can also carry its own rate with extra={"sample_every": N},
+    in which case it is sampled per message template.
+    """
+
+    def __init__(self, rules=None):
+        super().__init__()
+        self.rules = rules or {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        every = getattr(record, "sample_every", None)
+        key = (record.name, str(record.msg))
+        if every is None:
+            message = str(record.msg)
+            for text, rule_every in self.rules.items():
+                if text in message:
+                    every = rule_every
+                    key = text
+                    break
+        if not every or every <= 1:
+            return True
+
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % every == 0
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue the record as is, the listener thread does all the formatting"""
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def install_queue_logging(
+    filename="tradingapp.log",
+    level=logging.INFO,
+    max_bytes=10 * 1024 * 1024,
+    backup_count=5,
+    sampling=None,
+):
+    """Route the root logger through a queue to a background thread, return the listener"""
+    global _listener
+
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger()
+
+    # Size rotated file with structured records
+    file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+    file_handler.setFormatter(StructuredFormatter())
+
+    # Handlers already installed (e.g. by lumibot) keep working, from the listener thread
+    handlers = [file_handler] + list(root.handlers)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sampling))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    # Write what is left in the queue on exit
+    atexit.register(_listener.stop)
+    return _listener
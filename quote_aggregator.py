@@ -0,0 +1,213 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+"""
+Crypto Quote Aggregator
+
+Quotes a list of crypto assets on every configured venue (Kraken, Coinbase, Alpaca) at the same time and combines
+the answers into one snapshot: the median (or best) price of every asset across venues, how old the freshest quote
+is and how many venues answered.
+
+Every venue has its own timeout. A venue that is slow or down is left out of the snapshot instead of stalling the
+rebalance, and quotes older than max_age seconds are ignored. StubVenue serves fixed prices locally (with an
+optional delay or failure) to test all of this without any exchange.
+
+"""
+
+
+class StubVenue:
+    """Local venue with fixed prices, for tests"""
+
+    def __init__(self, name, prices, delay=0, fail=False, age=0, timeout=None):
+        self.name = name
+        self.prices = prices
+        self.delay = delay
+        self.fail = fail
+        self.age = age
+        self.timeout = timeout
+
+    def fetch_prices(self, symbols, quote):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.name} is down")
+        now = time.time()
+        return {symbol: (self.prices[symbol], now - self.age) for symbol in symbols if symbol in self.prices}
+
+
+class CcxtVenue:
+    """Last trade prices from a ccxt exchange (Kraken, Coinbase, ...)"""
+
+    def __init__(self, config, timeout=None):
+        import ccxt
+
+        params = {key: value for key, value in config.items() if key not in ("exchange_id", "margin", "sandbox")}
+        self.name = config["exchange_id"]
+        self.exchange = getattr(ccxt, self.name)(params)
+        self.timeout = timeout
+
+    def fetch_prices(self, symbols, quote):
+        pairs = {f"{symbol}/{quote}": symbol for symbol in symbols}
+        tickers = self.exchange.fetch_tickers(list(pairs))
+
+        prices = {}
+        for pair, ticker in tickers.items():
+            if pair in pairs and ticker.get("last"):
+                timestamp = ticker["timestamp"] / 1000 if ticker.get("timestamp") else time.time()
+                prices[pairs[pair]] = (ticker["last"], timestamp)
+        return prices
+
+
+class AlpacaCryptoVenue:
+    """Mid prices of the latest Alpaca crypto quotes"""
+
+    def __init__(self, config, timeout=None):
+        from alpaca.data.historical import CryptoHistoricalDataClient
+
+        self.name = "alpaca"
+        self.client = CryptoHistoricalDataClient(config["API_KEY"], config["API_SECRET"])
+        self.timeout = timeout
+
+    def fetch_prices(self, symbols, quote):
+        from alpaca.data.requests import CryptoLatestQuoteRequest
+
+        pairs = {f"{symbol}/{quote}": symbol for symbol in symbols}
+        quotes = self.client.get_crypto_latest_quote(CryptoLatestQuoteRequest(symbol_or_symbols=list(pairs)))
+
+        prices = {}
+        for pair, latest in quotes.items():
+            if pair in pairs and latest.bid_price and latest.ask_price:
+                prices[pairs[pair]] = ((latest.bid_price + latest.ask_price) / 2, latest.timestamp.timestamp())
+        return prices
+
+
+def venues_from_config():
+    """Create a venue for every exchange configured in config.py"""
+    from config import ALPACA_CONFIG, COINBASE_CONFIG, KRAKEN_CONFIG
+
+    venues = []
+    for exchange_config in (KRAKEN_CONFIG, COINBASE_CONFIG):
+        if exchange_config.get("exchange_id") and exchange_config.get("apiKey"):
+            venues.append(CcxtVenue(exchange_config))
+    if ALPACA_CONFIG.get("API_KEY"):
+        venues.append(AlpacaCryptoVenue(ALPACA_CONFIG))
+    return venues
+
+
+class QuoteSnapshot:
+    """Prices of every symbol on every venue, as (venue x symbol) arrays"""
+
+    def __init__(self, symbols, venues, prices, timestamps, taken_at, method="median"):
+        self.symbols = symbols
+        self.venues = venues
+        self.prices = prices
+        self.timestamps = timestamps
+        self.taken_at = taken_at
+        self.method = method
+
+        self._index = {symbol: i for i, symbol in enumerate(symbols)}
+
+        with np.errstate(invalid="ignore"):
+            answered = ~np.isnan(prices)
+            self.venue_count = answered.sum(axis=0)
+            has_quote = self.venue_count > 0
+
+            # Age of the freshest quote of every symbol
+            newest = np.nanmax(np.where(answered, timestamps, -np.inf), axis=0)
+            self.age = np.where(has_quote, taken_at - newest, np.inf)
+
+            # Aggregated price of every symbol
+            columns = prices[:, has_quote]
+            self.median = np.full(len(symbols), np.nan)
+            self.lowest = np.full(len(symbols), np.nan)
+            self.highest = np.full(len(symbols), np.nan)
+            if columns.size:
+                self.median[has_quote] = np.nanmedian(columns, axis=0)
+                self.lowest[has_quote] = np.nanmin(columns, axis=0)
+                self.highest[has_quote] = np.nanmax(columns, axis=0)
+
+    def best(self, side):
+        """Best price for a side: the lowest price to buy, the highest to sell"""
+        return self.lowest if side == "buy" else self.highest
+
+    def price(self, symbol, side=None):
+        """Aggregated price of a symbol, or None if no venue quoted it"""
+        i = self._index.get(symbol)
+        if i is None:
+            return None
+        values = self.best(side) if self.method == "best" and side else self.median
+        value = values[i]
+        return None if np.isnan(value) else float(value)
+
+
+class QuoteAggregator:
+    def __init__(self, venues, timeout=2.0, max_age=60, method="median"):
+        self.venues = venues
+
+        # Default timeout of the venues that don't set their own
+        self.timeout = timeout
+
+        # Quotes older than max_age seconds are ignored
+        self.max_age = max_age
+        self.method = method
+
+        # Kept open between snapshots: a venue that times out can finish in the background without blocking anyone
+        self.executor = ThreadPoolExecutor(max_workers=max(len(venues), 1), thread_name_prefix="quotes")
+
+        # Last request of every venue, a venue still busy with it is skipped
+        self.requests = [None] * len(venues)
+
+    def snapshot(self, symbols, quote="USD"):
+        """Quote the symbols on all the venues concurrently"""
+        start = time.monotonic()
+        futures = []
+        for v, venue in enumerate(self.venues):
+            if self.requests[v] is not None and not self.requests[v].done():
+                futures.append(None)
+                continue
+            self.requests[v] = self.executor.submit(venue.fetch_prices, symbols, quote)
+            futures.append(self.requests[v])
+
+        prices = np.full((len(self.venues), len(symbols)), np.nan)
+        timestamps = np.full((len(self.venues), len(symbols)), np.nan)
+        index = {symbol: i for i, symbol in enumerate(symbols)}
+
+        for v, (venue, future) in enumerate(zip(self.venues, futures)):
+            if future is None:
+                continue
+
+            venue_timeout = venue.timeout if venue.timeout is not None else self.timeout
+            try:
+                result = future.result(timeout=max(0, start + venue_timeout - time.monotonic()))
+            except Exception:
+                # Slow or failing venue, leave it out
+                continue
+
+            for symbol, (price, timestamp) in result.items():
+                if symbol in index and price is not None and price > 0:
+                    prices[v, index[symbol]] = price
+                    timestamps[v, index[symbol]] = timestamp
+
+        # Ignore stale quotes
+        taken_at = time.time()
+        prices[taken_at - timestamps > self.max_age] = np.nan
+
+        return QuoteSnapshot(symbols, [venue.name for venue in self.venues], prices, timestamps, taken_at, self.method)
+
+
+if __name__ == "__main__":
+    # Three local venues: one normal, one slow and one with stale quotes
+    aggregator = QuoteAggregator(
+        [
+            StubVenue("fast", {"DOGE": 0.101, "DOT": 6.02}),
+            StubVenue("slow", {"DOGE": 0.102, "DOT": 6.01}, delay=5),
+            StubVenue("stale", {"DOGE": 0.5, "DOT": 9.0}, age=600),
+        ],
+        timeout=0.5,
+    )
+    start = time.perf_counter()
+    snapshot = aggregator.snapshot(["DOGE", "DOT", "IMX"])
+    print(f"Snapshot in {time.perf_counter() - start:.3f}s")
+    for i, symbol in enumerate(snapshot.symbols):
+        print(symbol, snapshot.price(symbol), f"{snapshot.venue_count[i]} venues, {snapshot.age[i]:.1f}s old")
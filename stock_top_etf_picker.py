@@ -1,13 +1,15 @@
 from datetime import datetime
 
 import pandas as pd
-from lumibot.backtesting import YahooDataBacktesting
-from lumibot.brokers import Alpaca
-from lumibot.entities import TradingFee
 from lumibot.strategies.strategy import Strategy
-from lumibot.traders import Trader
 
+from account_ledger import AccountLedger, AccountLedgerMixin
+from checkpoint import Checkpoint
 from config import IS_BACKTESTING, STRATEGY_NAME
+from momentum_signals import MomentumSignals
+from profiling import profiled
+from strategy_scheduler import SharedDataMixin
+from symbol_universe import SymbolUniverse, fetch_yahoo_history, universe_symbols
 
 """
 Strategy Description
@@ -20,13 +22,15 @@ at which point it will sell the bottom N ETFs and buy the top N ETFs again.
 """
 
 
-class StockTopETFPicker(Strategy):
+class StockTopETFPicker(AccountLedgerMixin, SharedDataMixin, Strategy):
   parameters = {
     "symbols": [],  # The list of all symbols we will be analyzing
     "number_of_symbols":
     5,  # The number of symbols we will be holding at any given time
     "analysis_period": 1500,  # The number of days to analyze
     "rebalance_threshold": 0.08,  # The threshold to rebalance the portfolio
+    # Optional blend of lookbacks to rank on instead of analysis_period, e.g. {200: 0.5, 1500: 0.5}
+    "lookbacks": None,
   }
 
   def initialize(self):
@@ -36,17 +40,45 @@ class StockTopETFPicker(Strategy):
 
     self.minutes_before_closing = 1
 
+    # Load the symbol metadata index (built from Yahoo Finance when missing or stale) so symbols without enough
+    # history are skipped before fetching data
+    self.universe = SymbolUniverse.load(self.parameters["symbols"], fetch_history=fetch_yahoo_history)
+
+    # Price history already downloaded today, restored after a restart so it isn't downloaded again
+    self.checkpoint = Checkpoint(self.name, interval=300)
+    self.history_cache = {}
+    if not self.is_backtesting:
+      self.history_cache = self.checkpoint.load().get("history_cache", {})
+
+    # Local copy of the account, seeded from the broker once per iteration and updated by the order callbacks
+    self.ledger = AccountLedger(self)
+
     # self.set_market("24/7")
 
+  @profiled()
   def on_trading_iteration(self):
     # Get the parameters
     symbols = self.parameters["symbols"]
     number_of_symbols = self.parameters["number_of_symbols"]
     analysis_period = self.parameters["analysis_period"]
     rebalance_threshold = self.parameters["rebalance_threshold"]
+    lookbacks = self.parameters.get("lookbacks") or {analysis_period: 1}
+
+    # The history of the longest lookback covers all the others
+    history_length = max(lookbacks)
+
+    # Create a dictionary to store the closes of each symbol
+    closes = {}
 
-    # Create a dictionary to store the total returns for each symbol
-    total_returns = {}
+    # Drop the history downloaded on previous days
+    today = self.get_datetime().date()
+    self.history_cache = {
+      key: data
+      for key, data in self.history_cache.items() if key[2] == today
+    }
+
+    # Skip the symbols that were listed too recently to cover the analysis period
+    symbols = self.universe.covered_symbols(self.get_datetime(), history_length)
 
     # Log message
     self.log_message(f"Analyzing {len(symbols)} symbols: {symbols}")
@@ -54,7 +86,7 @@ class StockTopETFPicker(Strategy):
     # Loop through all the symbols
     for symbol in symbols:
       # Get the historical prices for the symbol
-      data = self.get_historical_prices(symbol, analysis_period, "day")
+      data = self.get_daily_history(symbol, history_length)
 
       # Check if we got any data
       if data is None:
@@ -67,7 +99,7 @@ class StockTopETFPicker(Strategy):
 
       # Check that the dataframe has at least 4.5/7 rows of the analysis_period (64%)
       # This is to make sure we got the right amount of data, after accounting for weekends and holidays
-      if len(df) < 4.5 / 7 * analysis_period:
+      if len(df) < 4.5 / 7 * history_length:
         continue
 
       # Get the price of the asset
@@ -77,16 +109,19 @@ class StockTopETFPicker(Strategy):
       if price < 1:
         continue
 
-      # Get the total return over the analysis period
-      total_return = df["close"].iloc[-1] / df["close"].iloc[0]
+      # Store the closes in the dictionary
+      closes[symbol] = df["close"]
 
-      # Store the total return in the dictionary
-      total_returns[symbol] = total_return
+    # Snapshot the downloaded history
+    if not self.is_backtesting:
+      self.checkpoint.save({"history_cache": self.history_cache})
 
-    # Convert the dictionary to a dataframe
-    total_returns_df = pd.DataFrame.from_dict(total_returns,
-                                              orient="index",
-                                              columns=["total_return"])
+    # Get the total return of every lookback (or their blend) from the prefix sums of the closes
+    if closes:
+      signals = MomentumSignals(pd.DataFrame(closes))
+      total_returns_df = signals.latest(lookbacks)[["total_return"]]
+    else:
+      total_returns_df = pd.DataFrame(columns=["total_return"])
 
     # Sort the dataframe by total return
     total_returns_df = total_returns_df.sort_values(by="total_return",
@@ -103,33 +138,30 @@ class StockTopETFPicker(Strategy):
         """
     self.log_message(message, broadcast=True)
 
-    # Get all our positions
-    positions = self.get_positions()
+    # Seed the account ledger from the broker, the sizing below doesn't ask the broker again
+    self.ledger.refresh()
 
-    # Create a positions dictionary
-    positions = {position.symbol: position for position in positions}
+    # Get all our positions (symbol -> quantity)
+    positions = dict(self.ledger.positions)
 
     # Get our portfolio value
-    portfolio_value = self.get_portfolio_value()
+    portfolio_value = self.ledger.portfolio_value
 
     # Loop through all the positions
-    for position in positions.values():
-      # Get the symbol of the position
-      symbol = position.symbol
-
+    for symbol, quantity in positions.items():
       # If we own a position that is not in the top N, sell it
       if symbol not in top_symbols and symbol != "USD":
         # Check that we own at least one share
-        if position.quantity < 1:
+        if quantity < 1:
           continue
 
-        # Sell the position
-        order = self.create_order(symbol, position.quantity, "sell")
-        self.submit_order(order)
-
         # Get the current price of the position
         price = self.get_last_price(symbol)
 
+        # Sell the position
+        order = self.create_order(symbol, quantity, "sell")
+        self.ledger.submit(order, price)
+
         # Add a marker to our chart for when we sold
         self.add_marker(f"Sell {symbol}",
                         symbol="triangle-down",
@@ -141,45 +173,41 @@ class StockTopETFPicker(Strategy):
 
     # Loop through all the top N symbols
     for symbol in top_symbols:
+      # Calculate the amount we should spend on the asset
+      amount_to_spend = portfolio_value / number_of_symbols
+
+      # Get the price of the asset
+      price = self.get_last_price(symbol)
+
+      # Get the amount of cash we have left, after the buy orders not filled yet
+      cash = self.ledger.available_cash
+
       # If we don't own a position in the top N, buy it
       if symbol not in positions:
-        # Calculate the amount we should spend on the asset
-        amount_to_spend = portfolio_value / number_of_symbols
-
         # Calculate the quantity of the asset we can buy
-        quantity = amount_to_spend // self.get_last_price(symbol)
-
-        # Get the amount of cash we have
-        cash = self.get_cash()
+        quantity = amount_to_spend // price
 
         # If we have enough cash to buy at least one share and we have enough cash to buy the asset, buy it
         if quantity >= 1 and cash >= amount_to_spend:
           order = self.create_order(symbol, quantity, "buy")
-          self.submit_order(order)
+          self.ledger.submit(order, price)
 
           # Add a marker to our chart for when we bought
           self.add_marker(
             f"Buy {symbol}",
             symbol="triangle-up",
-            value=self.get_last_price(symbol),
+            value=price,
             color="green",
           )
 
       # If we already own a position in the top N, make sure we own the right quantity
       else:
         # Get the current quantity of the position
-        quantity = positions[symbol].quantity
-
-        # Calculate the amount we should spend on the asset
-        amount_to_spend = portfolio_value / number_of_symbols
+        quantity = positions[symbol]
 
         # Calculate the quantity of the asset we should own
-        price = self.get_last_price(symbol)
         quantity_should_own = amount_to_spend // price
 
-        # Get the amount of cash we have
-        cash = self.get_cash()
-
         # If we should own more, buy more
         if quantity < quantity_should_own and cash >= amount_to_spend:
           # Calculate the quantity to buy
@@ -190,13 +218,13 @@ class StockTopETFPicker(Strategy):
           if pct_of_portfolio > rebalance_threshold:
             # Buy the position
             order = self.create_order(symbol, quantity_to_buy, "buy")
-            self.submit_order(order)
+            self.ledger.submit(order, price)
 
             # Add a marker to our chart for when we bought
             self.add_marker(
               f"Buy {symbol}",
               symbol="triangle-up",
-              value=self.get_last_price(symbol),
+              value=price,
               color="green",
             )
 
@@ -210,134 +238,32 @@ class StockTopETFPicker(Strategy):
           if pct_of_portfolio > rebalance_threshold:
             # Sell the position
             order = self.create_order(symbol, quantity_to_sell, "sell")
-            self.submit_order(order)
+            self.ledger.submit(order, price)
 
             # Add a marker to our chart for when we sold
             self.add_marker(
               f"Sell {symbol}",
               symbol="triangle-down",
-              value=self.get_last_price(symbol),
+              value=price,
               color="red",
             )
 
+  # =============Helper methods===================
+
+  def get_daily_history(self, symbol, length):
+    """Get the daily history of a symbol, reusing what was already downloaded today"""
+    if self.is_backtesting:
+      return self.get_historical_prices(symbol, length, "day")
+
+    key = (symbol, length, self.get_datetime().date())
+    if key not in self.history_cache:
+      self.history_cache[key] = self.get_historical_prices(symbol, length, "day")
+    return self.history_cache[key]
+
 
 def fetch_tickers():
-  country_etfs = [
-    "SPY",
-    "EFA",
-    "EWJ",
-    "EWG",
-    "EWU",
-    "EWC",
-    "EWZ",
-    "EWA",
-    "EWW",
-    "EWY",
-    "EWQ",
-    "EWP",
-    "EWI",
-    "EWT",
-    "EWL",
-    "EWM",
-    "EWS",
-    "EWH",
-    "EIS",
-    "ENZL",
-    "EIDO",
-    "EPHE",
-    "EPU",
-    "EZA",
-    "ECH",
-    "THD",
-    "TUR",
-    "ERUS",
-    "INDA",
-    "GREK",
-    "EDEN",
-    "EWD",
-    "NORW",
-    "EFNL",
-    "EWN",
-    "EWK",
-    "EIRL",
-    "EPOL",
-    "PGAL",
-    "EWO",
-    "EWI",
-    "EWP",
-    "EWQ",
-    "EWG",
-    "EWU",
-    "GREK",
-    "EWI",
-  ]
-
-  sector_etfs = [
-    "XLK",
-    "SMH",
-    "GLD",
-    "XME",
-    "URA",
-    "XLF",
-    "XLE",
-    "XLV",
-    "XLY",
-    "XLP",
-    "XLI",
-    "XLRE",
-    "XLC",
-    "XLB",
-    "XTL",
-    "XLU",
-    "IGV",
-    "FDN",
-    "IYT",
-    "IYR",
-    "IHF",
-    "ITB",
-    "GDX",
-    "SIL",
-    "KWEB",
-    "SOXX",
-    "ARKK",
-    "ARKG",
-    "ARKW",
-    "ARKF",
-    "ARKQ",
-    "CLOU",
-    "FIVG",
-    "ROBO",
-    "ESPO",
-    "BOTZ",
-    "HACK",
-  ]
-
-  leveraged_etfs = [
-    "TQQQ",
-    "UPRO",
-    "UDOW",
-    "SPXL",
-    "TECL",
-    "SOXL",
-    "FAS",
-    "NUGT",
-    "ERX",
-    "LABU",
-    "YINN",
-    "EURL",
-    "DUST",
-    "SDOW",
-    "SPXS",
-    "SQQQ",
-    "FAZ",
-    "SOXS",
-    "DRV",
-    "EDZ",
-    "UVXY",
-  ]
-
-  # Return the list of tickers
-  return country_etfs + sector_etfs + leveraged_etfs
+  # Return the deduplicated list of tickers
+  return universe_symbols()
 
 
 if __name__ == "__main__":
@@ -348,9 +274,13 @@ if __name__ == "__main__":
     ####
     # Run the strategy live
     ####
+    from lumibot.brokers import Alpaca
+    from lumibot.traders import Trader
+
     from config import (
       ALPACA_CONFIG,
     )
+    from queue_logging import install_queue_logging
 
     trader = Trader()
     broker = Alpaca(ALPACA_CONFIG)
@@ -367,6 +297,9 @@ if __name__ == "__main__":
       "symbols": tickers,
     })
     trader.add_strategy(strategy)
+
+    # Write the logs from a background thread, after lumibot installed its handlers
+    install_queue_logging("stock_top_etf_picker.log")
     trader.run_all()
 
   else:
@@ -374,6 +307,11 @@ if __name__ == "__main__":
     # Backtest the strategy
     ############################################
 
+    from lumibot.backtesting import YahooDataBacktesting
+    from lumibot.entities import TradingFee
+
+    from backtest_store import BacktestStore
+
     ####
     # Configuration Options
     ####
@@ -386,6 +324,8 @@ if __name__ == "__main__":
     # Start Backtesting
     ####
 
+    store = BacktestStore()
+
     days_to_analyze = [1500] #[1000, 1500, 2000, 2500] #[50, 100, 200, 300]  # [1000, 1500, 2000, 2500]
 
     for days in days_to_analyze:
@@ -405,24 +345,17 @@ if __name__ == "__main__":
         # polygon_has_paid_subscription=True,
       )
 
-      # Export the positions to a CSV file
-      positions = strat[1].get_positions()
-
-      # Create records list
-      records = []
-      for position in positions:
-        # Get the last price of the asset
-        last_price = strat[1].get_last_price(position.asset.symbol)
-
-        # Create the record
-        record = {
-          "symbol": position.asset.symbol,
-          "quantity": position.quantity,
-          "last_price": last_price,
-        }
-
-        # Add the record to the list
-        records.append(record)
+      # Save the equity curve, trades, orders and positions to the backtest store
+      store.save_lumibot_run(
+        "StockTopETFPicker",
+        {
+          "symbols": tickers,
+          "analysis_period": days,
+          "backtesting_start": backtesting_start,
+          "backtesting_end": backtesting_end,
+        },
+        strat[1],
+      )
 
-      positions_df = pd.DataFrame.from_records(records)
-      positions_df.to_csv("positions.csv", index=False)
\ No newline at end of file
+    # Compare all the runs of the sweep
+    print(store.summary().sort_values("cagr", ascending=False))
@@ -1,27 +1,39 @@
+import sys
+from datetime import date
+
 from alpaca.trading.client import TradingClient
 from alpaca.trading.enums import OrderSide, TimeInForce
 from alpaca.trading.requests import MarketOrderRequest
 from alpaca.trading.stream import TradingStream
 
 import config
+from stream_recorder import StreamRecorder, StreamReplayer
 
-trading_client = TradingClient(config.API_KEY, config.API_SECRET, paper=True)
-# account = dict(trading_client.get_account())
-# for k, v in account.items():
-#     print(f"{k}{v}")
+async def trade_status(data):
+    print(data)
 
-order_details = MarketOrderRequest(symbol="AAPL", 
-                                   qty=10, 
-                                   side=OrderSide.BUY, 
-                                   time_in_force=TimeInForce.DAY)
-order = trading_client.submit_order(order_data=order_details)
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--replay":
+        # Replay recorded trade updates as fast as possible: python3 stock_trading_bot_basic.py --replay streams/trade_updates_2024-06-24.bin
+        stats = StreamReplayer(sys.argv[2]).run({"trade_updates": trade_status}, speed=None)
+        print(stats)
+    else:
+        trading_client = TradingClient(config.API_KEY, config.API_SECRET, paper=True)
+        # account = dict(trading_client.get_account())
+        # for k, v in account.items():
+        #     print(f"{k}{v}")
 
-trades = TradingStream(config.API_KEY,
-                       config.API_SECRET,
-                       paper=True)
+        order_details = MarketOrderRequest(symbol="AAPL",
+                                           qty=10,
+                                           side=OrderSide.BUY,
+                                           time_in_force=TimeInForce.DAY)
+        order = trading_client.submit_order(order_data=order_details)
 
-async def trade_status(data):
-    print(data)
+        trades = TradingStream(config.API_KEY,
+                               config.API_SECRET,
+                               paper=True)
 
-trades.subscribe_trade_updates(trade_status)
-trades.run()
+        # Record the trade updates so they can be replayed with --replay
+        recorder = StreamRecorder(f"streams/trade_updates_{date.today()}.bin")
+        trades.subscribe_trade_updates(recorder.wrap(trade_status, "trade_updates"))
+        trades.run()
@@ -3,15 +3,25 @@ import alpaca_trade_api as tradeapi
 
 import config
 import numpy as np
+import pandas as pd
 import time
 import logging
 
+from bars import BarArray
+from checkpoint import Checkpoint
+from queue_logging import install_queue_logging
+
+# Log records are written by a background thread, never by the trading loop
+install_queue_logging('./tradingapp.log')
 logger = logging.getLogger()
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%a, %d %b %Y %H:%M:%S', filename='./tradingapp.log', filemode='w')
 
-pos_held = False
 symbol="AAPL"
 
+# Restore the state saved before the last restart
+checkpoint = Checkpoint("stock_trading_bot_ma")
+state = checkpoint.load()
+pos_held = state.get("pos_held", False)
+
 trading_client = TradingClient(config.API_KEY, config.API_SECRET, paper=True)
 
 #NEW SDK, DOESN'T ALLOW GETTING DATA FROM LAST 15 MINUTES
@@ -22,22 +32,41 @@ trading_client = TradingClient(config.API_KEY, config.API_SECRET, paper=True)
 
 api = tradeapi.REST(key_id=config.API_KEY, secret_key=config.API_SECRET)
 
-market_data = api.get_bars(symbol, tradeapi.TimeFrame.Minute).df
-#print(market_data.shape[0])
+# Minute bars kept in memory (about 10 trading days)
+MAX_BARS = 3900
+
+def get_bars(start=None):
+    bars = api.get_bars(symbol, tradeapi.TimeFrame.Minute, start=start)
+    return BarArray.from_records((bar._raw for bar in bars), maxlen=MAX_BARS)
+
+market_data = state.get("market_data")
+if isinstance(market_data, pd.DataFrame):
+    # Checkpoint written before the bars were stored as a BarArray
+    market_data = BarArray.from_dataframe(market_data, maxlen=MAX_BARS)
+if market_data is None or len(market_data) == 0:
+    market_data = get_bars()
+#print(len(market_data))
 
 while True:
+    # Only download the bars since the last one we have (e.g. the bars we missed while the bot was down)
+    start = market_data.last().datetime.isoformat() + "Z" if len(market_data) else None
+    market_data.extend(get_bars(start))
+
     # Get close list of the last 5 data points
-    if market_data:
-        close_list  = market_data.tail(5)['close'].values
-        close_list = np.array(close_list, dtype=np.float64) # Convert to numpy array
+    if len(market_data) >= 5:
+        close_list = market_data.tail(5)['close'].astype(np.float64)
         ma = np.mean(close_list)
         last_price = close_list[4] # Most recent closing price
-        logging.info(market_data)
         # print(close_list)
-        logging.info("Moving Average: " + str(ma))
-        logging.info("Last Price: " + str(last_price))
+        logging.info("Moving Average", extra={"fields": {
+            "symbol": symbol,
+            "bars": len(market_data),
+            "last_bar": market_data.last().datetime,
+            "moving_average": float(ma),
+            "last_price": float(last_price),
+        }})
         if ma + 1 < last_price and not pos_held: # If MA is more than 10 cents under price, and we haven't already bought
-                logging.info("Buy")
+                logging.info("Buy", extra={"fields": {"symbol": symbol, "qty": 5, "price": float(last_price)}})
                 api.submit_order(
                     symbol=symbol,
                     qty=5,
@@ -46,8 +75,9 @@ while True:
                     time_in_force='gtc'
                 )
                 pos_held = True
+                checkpoint.save({"pos_held": pos_held, "market_data": market_data}, force=True)
         elif ma - 1 > last_price and pos_held: # If MA is more than 10 cents above price, and we already bought
-                logging.info("Sell")
+                logging.info("Sell", extra={"fields": {"symbol": symbol, "qty": 5, "price": float(last_price)}})
                 api.submit_order(
                     symbol=symbol,
                     qty=5,
@@ -56,4 +86,6 @@ while True:
                     time_in_force='gtc'
                 )
                 pos_held = False
+                checkpoint.save({"pos_held": pos_held, "market_data": market_data}, force=True)
+    checkpoint.save({"pos_held": pos_held, "market_data": market_data})
     time.sleep(300)
\ No newline at end of file
@@ -1,24 +1,55 @@
-import alpaca_trade_api as trdeapi
+import sys
+from datetime import date
+
+import alpaca_trade_api as tradeapi
 from alpaca_trade_api import StreamConn
 
 import config
+from bars import Bar, BarArray
+from stream_recorder import StreamRecorder, StreamReplayer
 
 class PythonTradingBot:
-    def __init__(self):
-        self.slpaca = tradeapi.REST(config.APCA_API_KEY, config.APCA_API_SECRET, config.APCA_API_ENDPOINT, api_version="v2")
-    def run(self):
-        #on each minute
-        async def on_minute(conn, channel, bar):
-            #Entry
-            if bar.close >= bar.open and bar.open -bar.low > 0.1:
-                print("Buying on Doji Candle!")
+    def __init__(self, recorder=None, dry_run=False):
+        # In dry run (e.g. when replaying a recorded stream) no order is sent
+        self.dry_run = dry_run
+        self.alpaca = None if dry_run else tradeapi.REST(config.API_KEY, config.API_SECRET, config.ENDPOINT, api_version="v2")
+        self.recorder = recorder
+
+        # Minute bars of the session per symbol
+        self.bars = {}
+
+    #on each minute
+    async def on_minute(self, conn, channel, message):
+        bar = Bar.from_message(message)
+        symbol = getattr(message, "symbol", None) or "MSFT"
+        self.bars.setdefault(symbol, BarArray(maxlen=390)).append(bar)
+
+        #Entry
+        if bar.close >= bar.open and bar.open -bar.low > 0.1:
+            print("Buying on Doji Candle!")
+            if not self.dry_run:
                 self.alpaca.submit_order("MSFT", 1, "buy", "market", "day")
-            #TODO: Take profit at 1% increase (e.g. 170 take profit at 171.7)    
+        #TODO: Take profit at 1% increase (e.g. 170 take profit at 171.7)
 
+    def run(self):
         #Connect to get streaming stock market data
         self.conn = StreamConn('Polygon Key Here', 'Polygon Key Here', 'wss://alpaca.socket.polygon.io/stocks')
-        on_minute = self.conn(r'AM$')(on_minute)
+
+        # Record every bar so the session can be replayed later
+        on_minute = self.on_minute
+        if self.recorder is not None:
+            on_minute = self.recorder.wrap(on_minute, "AM")
+        self.conn.on(r'^AM$')(on_minute)
+
         #Subscibe to Microsoft Stock
-        conn.run(['AM.MSFT'])
-bd = PythonTradingBot()
-bd.run()
\ No newline at end of file
+        self.conn.run(['AM.MSFT'])
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--replay":
+        # Replay a recorded session as fast as possible: python3 stock_trading_bot_polygon.py --replay streams/AM_2024-06-24.bin
+        bd = PythonTradingBot(dry_run=True)
+        stats = StreamReplayer(sys.argv[2]).run({"AM": lambda bar: bd.on_minute(None, "AM", bar)}, speed=None)
+        print(stats)
+    else:
+        bd = PythonTradingBot(recorder=StreamRecorder(f"streams/AM_{date.today()}.bin"))
+        bd.run()
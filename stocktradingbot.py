@@ -4,82 +4,128 @@ from lumibot.strategies.strategy import Strategy
 from datetime import datetime 
 from alpaca_trade_api import REST
 from datetime import timedelta 
-from finbert_utils import estimate_sentiment
+from concurrent.futures import ThreadPoolExecutor
+from finbert_utils import estimate_sentiment_batch
+from checkpoint import Checkpoint
+from profiling import profiled
+from strategy_scheduler import SharedDataMixin
 
 import config
 
-class MLTrader(Strategy): 
-    def initialize(self, symbol:str="SPY", cash_at_risk:float=.5): 
-        self.symbol = symbol
+class MLTrader(SharedDataMixin, Strategy): 
+    def initialize(self, symbol:str="SPY", cash_at_risk:float=.5, symbols:list=None): 
+        # A watchlist of symbols, or the single symbol of the older parameters
+        self.symbols = list(symbols) if symbols else [symbol]
         self.sleeptime = "24H" 
-        self.last_trade = None 
+        self.last_trade = {}
         self.cash_at_risk = cash_at_risk
         self.api = REST(base_url=config.ENDPOINT, key_id=config.API_KEY, secret_key=config.API_SECRET)
 
-    def position_sizing(self): 
-        cash = self.get_cash() 
-        last_price = self.get_last_price(self.symbol)
-        quantity = round(cash * self.cash_at_risk / last_price,0)
-        return cash, last_price, quantity
+        # The news of every symbol is fetched at the same time
+        self.news_executor = ThreadPoolExecutor(max_workers=min(len(self.symbols), 8), thread_name_prefix="news")
+
+        # Restore the last trades saved before the last restart
+        self.checkpoint = Checkpoint(self.name)
+        if not self.is_backtesting:
+            last_trade = self.checkpoint.load().get("last_trade") or {}
+            if isinstance(last_trade, str):
+                # Checkpoint of the single symbol version
+                last_trade = {self.symbols[0]: last_trade}
+            self.last_trade = last_trade
+
+    def save_state(self):
+        if not self.is_backtesting:
+            self.checkpoint.save({"last_trade": self.last_trade}, force=True)
+
+    def position_sizing(self, symbol, cash): 
+        # The cash at risk is split evenly between the symbols
+        last_price = self.get_last_price(symbol)
+        quantity = round(cash * self.cash_at_risk / len(self.symbols) / last_price,0)
+        return last_price, quantity
 
     def get_dates(self): 
         today = self.get_datetime()
         three_days_prior = today - timedelta(days=3)
         return today.strftime('%Y-%m-%d'), three_days_prior.strftime('%Y-%m-%d')
 
-    def get_sentiment(self): 
+    def get_headlines(self, symbol, start, end): 
+        news = self.api_call(self.api.get_news, 
+                             symbol=symbol, 
+                             start=start, 
+                             end=end) 
+        return [ev.__dict__["_raw"]["headline"] for ev in news]
+
+    def get_sentiments(self): 
+        """(probability, sentiment) of every symbol, all the headlines scored in one batch"""
         today, three_days_prior = self.get_dates()
-        news = self.api.get_news(symbol=self.symbol, 
-                                 start=three_days_prior, 
-                                 end=today) 
-        news = [ev.__dict__["_raw"]["headline"] for ev in news]
-        probability, sentiment = estimate_sentiment(news)
-        return probability, sentiment 
+        headlines = self.news_executor.map(lambda symbol: self.get_headlines(symbol, three_days_prior, today), self.symbols)
+        return estimate_sentiment_batch(dict(zip(self.symbols, headlines)))
 
+    def close_position(self, symbol): 
+        """Cancel the open orders of a symbol and close its position (sell_all for one symbol)"""
+        for order in self.get_orders():
+            if order.asset.symbol == symbol and order.is_active():
+                self.cancel_order(order)
+
+        position = self.get_position(symbol)
+        if position is not None and position.quantity != 0:
+            side = "sell" if position.quantity > 0 else "buy"
+            self.submit_order(self.create_order(symbol, abs(position.quantity), side))
+
+    @profiled()
     def on_trading_iteration(self):
-        cash, last_price, quantity = self.position_sizing() 
-        probability, sentiment = self.get_sentiment()
+        cash = self.get_cash()
+        sentiments = self.get_sentiments()
+
+        for symbol in self.symbols:
+            probability, sentiment = sentiments[symbol]
+            if probability <= .999 or sentiment == "neutral":
+                continue
 
-        if cash > last_price: 
-            if sentiment == "positive" and probability > .999: 
-                if self.last_trade == "sell": 
-                    self.sell_all() 
-                order = self.create_order(
-                    self.symbol, 
-                    quantity, 
-                    "buy", 
-                    type="bracket", 
-                    take_profit_price=last_price*1.20, 
-                    stop_loss_price=last_price*.95
-                )
-                self.submit_order(order) 
-                self.last_trade = "buy"
-            elif sentiment == "negative" and probability > .999: 
-                if self.last_trade == "buy": 
-                    self.sell_all() 
-                order = self.create_order(
-                    self.symbol, 
-                    quantity, 
-                    "sell", 
-                    type="bracket", 
-                    take_profit_price=last_price*.8, 
-                    stop_loss_price=last_price*1.05
-                )
-                self.submit_order(order) 
-                self.last_trade = "sell"
+            last_price, quantity = self.position_sizing(symbol, cash)
+            if cash > last_price and quantity > 0: 
+                if sentiment == "positive": 
+                    if self.last_trade.get(symbol) == "sell": 
+                        self.close_position(symbol) 
+                    order = self.create_order(
+                        symbol, 
+                        quantity, 
+                        "buy", 
+                        type="bracket", 
+                        take_profit_price=last_price*1.20, 
+                        stop_loss_price=last_price*.95
+                    )
+                    self.submit_order(order) 
+                    self.last_trade[symbol] = "buy"
+                    self.save_state()
+                elif sentiment == "negative": 
+                    if self.last_trade.get(symbol) == "buy": 
+                        self.close_position(symbol) 
+                    order = self.create_order(
+                        symbol, 
+                        quantity, 
+                        "sell", 
+                        type="bracket", 
+                        take_profit_price=last_price*.8, 
+                        stop_loss_price=last_price*1.05
+                    )
+                    self.submit_order(order) 
+                    self.last_trade[symbol] = "sell"
+                    self.save_state()
 
-start_date = datetime(2024,6,1)
-end_date = datetime(2024,6,24) 
-broker = Alpaca(config.ALPACA_CONFIG) 
-strategy = MLTrader(name='mlstrat', broker=broker, 
-                    parameters={"symbol":"SPY", 
-                                "cash_at_risk":.5})
-strategy.backtest(
-    YahooDataBacktesting, 
-    start_date, 
-    end_date, 
-    parameters={"symbol":"SPY", "cash_at_risk":.5}
-)
-# trader = Trader()
-# trader.add_strategy(strategy)
-# trader.run_all()
\ No newline at end of file
+if __name__ == "__main__":
+    start_date = datetime(2024,6,1)
+    end_date = datetime(2024,6,24) 
+    broker = Alpaca(config.ALPACA_CONFIG) 
+    strategy = MLTrader(name='mlstrat', broker=broker, 
+                        parameters={"symbols":["SPY", "AAPL", "MSFT", "NVDA"], 
+                                    "cash_at_risk":.5})
+    strategy.backtest(
+        YahooDataBacktesting, 
+        start_date, 
+        end_date, 
+        parameters={"symbols":["SPY", "AAPL", "MSFT", "NVDA"], "cash_at_risk":.5}
+    )
+    # trader = Trader()
+    # trader.add_strategy(strategy)
+    # trader.run_all()
\ No newline at end of file
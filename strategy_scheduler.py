@@ -0,0 +1,323 @@
+import heapq
+import importlib
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Multi-Strategy Scheduler
+
+Runs several lumibot strategies in one process instead of one process (and one broker, and one set of data
+fetches) per strategy script:
+
+- Every strategy gets its own iteration interval (its sleeptime) and a staggered start, so they don't all hit the
+  broker at the same moment.
+- Strategies that mix in SharedDataMixin share a single fetch when they ask for the same bars or last price:
+  identical requests made within the cache TTL (or while the first request is still in flight) are served from
+  one call.
+- Every call that does reach the API goes through a global ApiBudget (max calls per period): the bars and last
+  price fetches, the account and order calls (get_cash, get_positions, submit_order, ...) and any other call a
+  strategy wraps with api_call (e.g. MLTrader's news requests).
+- Each iteration runs in its own worker thread and exceptions are caught per strategy, so a slow or failing
+  strategy doesn't hold up or stop the others.
+
+The scheduler doesn't wait for market hours like lumibot's Trader does; use the offsets to place iterations
+where they belong in the trading day.
+
+Example:
+    python3 strategy_scheduler.py StockTopETFPicker CustomETF
+
+"""
+
+logger = logging.getLogger(__name__)
+
+# Strategy class name -> module that defines it
+STRATEGIES = {
+    "CustomETF": "crypto_custom_etf",
+    "StockTopETFPicker": "stock_top_etf_picker",
+    "MLTrader": "stocktradingbot",
+}
+
+SLEEPTIME_UNITS = {"S": 1, "M": 60, "H": 3600, "D": 86400}
+
+
+def sleeptime_seconds(sleeptime):
+    """Convert a lumibot sleeptime ("30S", "5M", "24H", "1D" or minutes as a number) to seconds"""
+    if isinstance(sleeptime, (int, float)):
+        return sleeptime * 60
+    return float(sleeptime[:-1]) * SLEEPTIME_UNITS[sleeptime[-1].upper()]
+
+
+class ApiBudget:
+    """Global budget of API calls over a sliding window of period seconds"""
+
+    def __init__(self, max_calls, period=60):
+        self.max_calls = max_calls
+        self.period = period
+        self.calls = deque()
+        self.total_calls = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a call fits in the budget and count it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    self.total_calls += 1
+                    return
+
+                wait = self.period - (now - self.calls[0])
+            time.sleep(wait)
+
+
+class SharedDataCache:
+    """Cache shared by all the strategies of a scheduler, with one fetch per key"""
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.values = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, key, ttl, fetcher):
+        """Return the cached value for key, or call fetcher once and cache its result for ttl seconds"""
+        while True:
+            with self.lock:
+                entry = self.values.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    self.hits += 1
+                    return entry[1]
+
+                # Another strategy is already fetching this key, wait for its result
+                event = self.in_flight.get(key)
+                if event is None:
+                    event = self.in_flight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+
+        try:
+            if self.budget is not None:
+                self.budget.acquire()
+            value = fetcher()
+            with self.lock:
+                self.values[key] = (time.monotonic() + ttl, value)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+    def expire(self):
+        """Drop the expired entries"""
+        now = time.monotonic()
+        with self.lock:
+            self.values = {key: entry for key, entry in self.values.items() if entry[0] > now}
+
+
+class SharedDataMixin:
+    """Route a strategy's bars and last price requests through the scheduler's shared cache, and its account and
+    order calls through the scheduler's API budget
+
+    Without a scheduler (shared_data is None) or when backtesting, the strategy calls the broker directly as usual.
+    """
+
+    shared_data = None
+
+    # Seconds a shared result stays valid
+    history_ttl = 3600
+    last_price_ttl = 15
+
+    def get_historical_prices(self, asset, length, timestep="", *args, **kwargs):
+        if self.shared_data is None or self.is_backtesting:
+            return super().get_historical_prices(asset, length, timestep, *args, **kwargs)
+
+        key = ("bars", str(asset), length, timestep, args, tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+        return self.shared_data.fetch(
+            key,
+            self.history_ttl,
+            lambda: super(SharedDataMixin, self).get_historical_prices(asset, length, timestep, *args, **kwargs),
+        )
+
+    def get_last_price(self, asset, *args, **kwargs):
+        if self.shared_data is None or self.is_backtesting:
+            return super().get_last_price(asset, *args, **kwargs)
+
+        key = ("last_price", str(asset), tuple(str(arg) for arg in args),
+               tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+        return self.shared_data.fetch(
+            key,
+            self.last_price_ttl,
+            lambda: super(SharedDataMixin, self).get_last_price(asset, *args, **kwargs),
+        )
+
+    def api_call(self, function, *args, **kwargs):
+        """Call function (an API request) once it fits in the scheduler's API budget"""
+        if self.shared_data is not None and self.shared_data.budget is not None and not self.is_backtesting:
+            self.shared_data.budget.acquire()
+        return function(*args, **kwargs)
+
+    # Account and order calls, each one is a broker request when trading live
+
+    def get_cash(self, *args, **kwargs):
+        return self.api_call(super().get_cash, *args, **kwargs)
+
+    def get_portfolio_value(self, *args, **kwargs):
+        return self.api_call(super().get_portfolio_value, *args, **kwargs)
+
+    def get_positions(self, *args, **kwargs):
+        return self.api_call(super().get_positions, *args, **kwargs)
+
+    def get_position(self, *args, **kwargs):
+        return self.api_call(super().get_position, *args, **kwargs)
+
+    def get_orders(self, *args, **kwargs):
+        return self.api_call(super().get_orders, *args, **kwargs)
+
+    def submit_order(self, *args, **kwargs):
+        return self.api_call(super().submit_order, *args, **kwargs)
+
+    def cancel_order(self, *args, **kwargs):
+        return self.api_call(super().cancel_order, *args, **kwargs)
+
+
+class StrategyScheduler:
+    def __init__(self, max_api_calls=200, api_period=60, stagger=30):
+        self.budget = ApiBudget(max_api_calls, api_period)
+        self.shared_data = SharedDataCache(self.budget)
+
+        # Seconds between the first iterations of two consecutive strategies
+        self.stagger = stagger
+
+        self.entries = []
+        self.running = threading.Event()
+
+    def add_strategy(self, strategy, interval=None, offset=None):
+        """Host a strategy, by default at its own sleeptime and staggered after the previous one"""
+        if interval is None:
+            interval = sleeptime_seconds(strategy.sleeptime)
+        if offset is None:
+            offset = len(self.entries) * self.stagger
+
+        strategy.shared_data = self.shared_data
+        self.entries.append(
+            {
+                "strategy": strategy,
+                "interval": interval,
+                "offset": offset,
+                "future": None,
+                "iterations": 0,
+                "errors": 0,
+            }
+        )
+
+    def run(self, duration=None):
+        """Run the strategies until stop() is called (or for duration seconds)"""
+        start = time.monotonic()
+        queue = [(start + entry["offset"], i) for i, entry in enumerate(self.entries)]
+        heapq.heapify(queue)
+
+        self.running.set()
+        with ThreadPoolExecutor(max_workers=max(len(self.entries), 1), thread_name_prefix="strategy") as pool:
+            while self.running.is_set() and queue:
+                due, i = heapq.heappop(queue)
+                if duration is not None and due - start > duration:
+                    break
+
+                # Sleep until the next iteration is due, waking up early on stop()
+                wait = due - time.monotonic()
+                if wait > 0 and self._sleep(wait):
+                    break
+
+                entry = self.entries[i]
+                future = entry["future"]
+                if future is not None and not future.done():
+                    # The previous iteration is still running, skip this one
+                    logger.warning(f"{entry['strategy'].name} is still running, skipping an iteration")
+                else:
+                    entry["future"] = pool.submit(self._run_iteration, entry)
+
+                heapq.heappush(queue, (due + entry["interval"], i))
+                self.shared_data.expire()
+
+        self.running.clear()
+
+    def stop(self):
+        self.running.clear()
+
+    def stats(self):
+        return {
+            "api_calls": self.budget.total_calls,
+            "cache_hits": self.shared_data.hits,
+            "cache_misses": self.shared_data.misses,
+            "strategies": {
+                entry["strategy"].name: {"iterations": entry["iterations"], "errors": entry["errors"]}
+                for entry in self.entries
+            },
+        }
+
+    # =============Helper methods===================
+
+    def _sleep(self, seconds):
+        """Sleep in small steps so stop() is noticed, return True if stopped"""
+        end = time.monotonic() + seconds
+        while self.running.is_set():
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, 1))
+        return True
+
+    def _run_iteration(self, entry):
+        strategy = entry["strategy"]
+        try:
+            strategy.on_trading_iteration()
+            entry["iterations"] += 1
+        except Exception:
+            entry["errors"] += 1
+            logger.exception(f"Iteration of {strategy.name} failed")
+
+
+def initialize_strategy(strategy):
+    """Call initialize with the strategy parameters it accepts, like lumibot's executor does"""
+    signature = inspect.signature(strategy.initialize)
+    kwargs = {key: value for key, value in strategy.parameters.items() if key in signature.parameters}
+    strategy.initialize(**kwargs)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from config import get_broker
+
+    logging.basicConfig(level=logging.INFO)
+
+    names = sys.argv[1:] or ["StockTopETFPicker", "CustomETF"]
+    broker = get_broker()
+    scheduler = StrategyScheduler()
+
+    for name in names:
+        module = importlib.import_module(STRATEGIES[name])
+        parameters = {}
+        if name == "StockTopETFPicker":
+            parameters["symbols"] = module.fetch_tickers()
+
+        strategy = getattr(module, name)(broker=broker, name=name, parameters=parameters)
+        initialize_strategy(strategy)
+        scheduler.add_strategy(strategy)
+
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    print(scheduler.stats())
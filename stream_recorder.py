@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import time
+from types import SimpleNamespace
+
+"""
+Stream Recorder and Replayer
+
+The recorder captures the websocket messages of the streaming bots (Polygon minute bars, Alpaca trade updates) to
+a compact append-only binary log. The replayer feeds the log back to the same handlers at real speed (1x), N times
+faster, or as fast as possible, so a full trading day can be reproduced in seconds and the handlers can be
+benchmarked on a real mix of messages.
+
+File format: an 8 byte magic header, then one record per message:
+    int64 receive time (ns since epoch) | uint16 channel length | uint32 payload length | channel | payload
+The payload is the pickled raw message (the dict behind alpaca's entities and models). A recorder opening an
+existing log (a restart on the same day) first cuts off the record a crash may have left half written.
+
+Examples:
+    python3 stream_recorder.py streams/AM_2024-06-24.bin              # read the log and report its contents
+    python3 stream_recorder.py streams/AM_2024-06-24.bin --speed 60   # replay it at 60x into a no-op handler
+
+"""
+
+MAGIC = b"TBSTRM1\n"
+HEADER = struct.Struct("<qHI")
+
+logger = logging.getLogger(__name__)
+
+
+def to_raw(message):
+    """Plain data behind a stream message"""
+    if hasattr(message, "_raw"):
+        return message._raw
+    if hasattr(message, "model_dump"):
+        return message.model_dump()
+    return message
+
+
+def from_raw(raw):
+    """Give dict messages attribute access again (bar.close, update.order.symbol), like the original entities"""
+    if isinstance(raw, dict) and all(isinstance(key, str) for key in raw):
+        return SimpleNamespace(**{key: from_raw(value) for key, value in raw.items()})
+    if isinstance(raw, list):
+        return [from_raw(value) for value in raw]
+    return raw
+
+
+def _records(f, path):
+    """Yield (offset, receive time ns, channel, raw message) from after the magic header
+
+    Stops at a record cut short by a crash (the end of the log), raises ValueError at a record that can't be decoded.
+    """
+    while True:
+        offset = f.tell()
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        timestamp, channel_length, payload_length = HEADER.unpack(header)
+        channel = f.read(channel_length)
+        payload = f.read(payload_length)
+        if len(channel) < channel_length or len(payload) < payload_length:
+            return
+        try:
+            yield offset, timestamp, channel.decode("utf-8"), pickle.loads(payload)
+        except Exception as e:
+            raise ValueError(f"{path}: corrupt log at offset {offset} ({type(e).__name__}: {e})") from e
+
+
+class StreamRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            # Same day log after a restart: append after the last complete record
+            self.file = open(path, "r+b")
+            self._truncate_torn_record()
+        else:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+
+        # Flush to disk at most every flush_interval seconds, a crash loses at most that much
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.count = 0
+
+    def _truncate_torn_record(self):
+        """Drop what a crash left after the last complete record, so the new records stay readable"""
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not a stream log")
+
+        end = self.file.tell()
+        try:
+            for _ in _records(self.file, self.path):
+                end = self.file.tell()
+        except ValueError as e:
+            logger.warning(str(e))
+
+        size = self.file.seek(0, os.SEEK_END)
+        if size > end:
+            logger.warning(f"{self.path}: dropping {size - end} bytes of a record cut short at offset {end}")
+            self.file.truncate(end)
+        self.file.seek(end)
+
+    def record(self, channel, message):
+        payload = pickle.dumps(to_raw(message), protocol=pickle.HIGHEST_PROTOCOL)
+        channel_bytes = channel.encode("utf-8")
+        self.file.write(HEADER.pack(time.time_ns(), len(channel_bytes), len(payload)))
+        self.file.write(channel_bytes)
+        self.file.write(payload)
+        self.count += 1
+
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def wrap(self, handler, channel):
+        """Wrap an async stream handler so every message it gets is recorded first
+
+        The message is the last positional argument, e.g. handler(data) or handler(conn, channel, bar).
+        """
+        async def recorded_handler(*args):
+            self.record(channel, args[-1])
+            return await handler(*args)
+
+        return recorded_handler
+
+    def close(self):
+        self.file.flush()
+        self.file.close()
+
+
+def read_records(path):
+    """Yield (receive time ns, channel, raw message) for every record of a log"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a stream log")
+
+        # A record cut short by a crash ends the log
+        for _, timestamp, channel, raw in _records(f, path):
+            yield timestamp, channel, raw
+
+
+class StreamReplayer:
+    def __init__(self, path):
+        self.path = path
+
+    async def replay(self, handlers, speed=1.0):
+        """Feed the recorded messages to the handlers of their channels
+
+        handlers maps a channel to a callable taking the message (sync or async). speed is 1 for real time,
+        N for N times faster and None (or 0) for as fast as possible.
+        Returns the number of messages, the wall time, the throughput and the time spent in the handlers.
+        """
+        start = time.perf_counter()
+        handler_time = 0.0
+        count = 0
+        first_timestamp = None
+
+        for timestamp, channel, raw in read_records(self.path):
+            handler = handlers.get(channel)
+            if handler is None:
+                continue
+
+            # Wait until the message is due at the replay speed
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            if speed:
+                due = (timestamp - first_timestamp) / 1e9 / speed
+                wait = due - (time.perf_counter() - start)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            handler_start = time.perf_counter()
+            result = handler(from_raw(raw))
+            if asyncio.iscoroutine(result):
+                await result
+            handler_time += time.perf_counter() - handler_start
+            count += 1
+
+        elapsed = time.perf_counter() - start
+        return {
+            "messages": count,
+            "seconds": elapsed,
+            "messages_per_second": count / elapsed if elapsed > 0 else float("inf"),
+            "handler_seconds": handler_time,
+        }
+
+    def run(self, handlers, speed=1.0):
+        return asyncio.run(self.replay(handlers, speed))
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed (default: as fast as possible)")
+    args = parser.parse_args()
+
+    channels = Counter(channel for _, channel, _ in read_records(args.path))
+    print(f"{sum(channels.values())} messages: {dict(channels)}")
+
+    # Replay into no-op handlers to measure the decoding throughput
+    stats = StreamReplayer(args.path).run({channel: lambda message: None for channel in channels}, args.speed)
+    print(stats)
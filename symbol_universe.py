@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+"""
+Symbol Universe
+
+The ETF universe used by the StockTopETFPicker strategy, deduplicated and kept in a stable order, with metadata
+for every symbol: asset class, leveraged/inverse flags, listing date and typical price.
+
+The listing date and typical price come from a cached index file (symbol_index.json). The strategy builds it from
+Yahoo Finance the first time it starts, rebuilds it once it is older than INDEX_MAX_AGE and completes it when new
+symbols are added; `python symbol_universe.py` rebuilds it by hand. With the index loaded, symbols whose history
+can't cover the analysis period are skipped before any data request is made.
+
+"""
+
+# On Lambda only /tmp is writable, so the file can be moved with the SYMBOL_INDEX_FILE environment variable
+INDEX_FILE = os.environ.get("SYMBOL_INDEX_FILE", "symbol_index.json")
+INDEX_MAX_AGE = timedelta(days=30)
+
+logger = logging.getLogger(__name__)
+
+COUNTRY_ETFS = [
+    "SPY", "EFA", "EWJ", "EWG", "EWU", "EWC", "EWZ", "EWA", "EWW", "EWY",
+    "EWQ", "EWP", "EWI", "EWT", "EWL", "EWM", "EWS", "EWH", "EIS", "ENZL",
+    "EIDO", "EPHE", "EPU", "EZA", "ECH", "THD", "TUR", "ERUS", "INDA", "GREK",
+    "EDEN", "EWD", "NORW", "EFNL", "EWN", "EWK", "EIRL", "EPOL", "PGAL", "EWO",
+]
+
+SECTOR_ETFS = [
+    "XLK", "SMH", "GLD", "XME", "URA", "XLF", "XLE", "XLV", "XLY", "XLP",
+    "XLI", "XLRE", "XLC", "XLB", "XTL", "XLU", "IGV", "FDN", "IYT", "IYR",
+    "IHF", "ITB", "GDX", "SIL", "KWEB", "SOXX", "ARKK", "ARKG", "ARKW", "ARKF",
+    "ARKQ", "CLOU", "FIVG", "ROBO", "ESPO", "BOTZ", "HACK",
+]
+
+LEVERAGED_ETFS = [
+    "TQQQ", "UPRO", "UDOW", "SPXL", "TECL", "SOXL", "FAS", "NUGT", "ERX", "LABU",
+    "YINN", "EURL", "DUST", "SDOW", "SPXS", "SQQQ", "FAZ", "SOXS", "DRV", "EDZ",
+    "UVXY",
+]
+
+# Leveraged ETFs that move against their underlying
+INVERSE_ETFS = {"DUST", "SDOW", "SPXS", "SQQQ", "FAZ", "SOXS", "DRV", "EDZ"}
+
+
+def dedupe(symbols):
+    """Remove duplicate symbols, keeping the first occurrence of each"""
+    return list(dict.fromkeys(symbols))
+
+
+def universe_symbols():
+    """Return the deduplicated, ordered ETF universe"""
+    return dedupe(COUNTRY_ETFS + SECTOR_ETFS + LEVERAGED_ETFS)
+
+
+def asset_class(symbol):
+    if symbol in COUNTRY_ETFS:
+        return "country"
+    if symbol in SECTOR_ETFS:
+        return "sector"
+    if symbol in LEVERAGED_ETFS:
+        return "leveraged"
+    return "unknown"
+
+
+class SymbolUniverse:
+    def __init__(self, symbols=None, index=None):
+        self.symbols = dedupe(symbols if symbols is not None else universe_symbols())
+
+        # symbol -> {"listing_date": date, "typical_price": float}
+        self.index = index or {}
+
+    @classmethod
+    def load(cls, symbols=None, path=INDEX_FILE, fetch_history=None, max_age=INDEX_MAX_AGE):
+        """Load the universe with the cached index file, if there is one
+
+        With fetch_history (see build_index), the index is built and saved when the file is missing or older than
+        max_age, and completed with the symbols it doesn't have yet.
+        """
+        index = {}
+        updated = None
+        if os.path.exists(path):
+            with open(path) as f:
+                raw = json.load(f)
+            if raw.get("updated"):
+                updated = datetime.fromisoformat(raw["updated"])
+            for symbol, entry in raw.get("symbols", {}).items():
+                listing_date = entry.get("listing_date")
+                index[symbol] = {
+                    "listing_date": date.fromisoformat(listing_date) if listing_date else None,
+                    "typical_price": entry.get("typical_price"),
+                }
+        universe = cls(symbols, index)
+
+        if fetch_history is not None:
+            if updated is None or datetime.now() - updated > max_age:
+                missing = universe.symbols
+            else:
+                missing = [symbol for symbol in universe.symbols if symbol not in index]
+            if missing:
+                universe.refresh_index(fetch_history, missing, path)
+        return universe
+
+    def refresh_index(self, fetch_history, symbols, path=INDEX_FILE):
+        """Build the index of the symbols and save it, keeping the universe usable if the data source isn't"""
+        logger.info(f"Building the symbol index of {len(symbols)} symbols")
+        try:
+            self.build_index(fetch_history, symbols)
+        except ImportError as e:
+            logger.warning(f"Symbol index not built, every symbol is kept: {e}")
+            return
+        try:
+            self.save(path)
+        except OSError as e:
+            logger.warning(f"Symbol index not saved: {e}")
+
+    def save(self, path=INDEX_FILE):
+        raw = {
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "symbols": {
+                symbol: {
+                    "listing_date": entry["listing_date"].isoformat() if entry.get("listing_date") else None,
+                    "typical_price": entry.get("typical_price"),
+                }
+                for symbol, entry in self.index.items()
+            },
+        }
+
+        # Write to a temporary file first so a crash never leaves a broken index behind
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(raw, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def metadata(self, symbol):
+        """Return the metadata of a symbol"""
+        entry = self.index.get(symbol, {})
+        return {
+            "symbol": symbol,
+            "asset_class": asset_class(symbol),
+            "leveraged": symbol in LEVERAGED_ETFS,
+            "inverse": symbol in INVERSE_ETFS,
+            "listing_date": entry.get("listing_date"),
+            "typical_price": entry.get("typical_price"),
+        }
+
+    def has_coverage(self, symbol, as_of, analysis_period):
+        """Check whether the symbol can have enough history for the analysis period
+
+        The strategy needs at least 4.5/7 of analysis_period daily bars. There are never more bars than
+        calendar days since the listing, so a symbol listed fewer than that many days ago can't pass
+        and is skipped without fetching it. Symbols missing from the index are always kept.
+        """
+        listing_date = self.index.get(symbol, {}).get("listing_date")
+        if listing_date is None:
+            return True
+
+        if isinstance(as_of, datetime):
+            as_of = as_of.date()
+        return (as_of - listing_date).days >= 4.5 / 7 * analysis_period
+
+    def covered_symbols(self, as_of, analysis_period):
+        """Return the symbols that can cover the analysis period on the given date"""
+        return [symbol for symbol in self.symbols if self.has_coverage(symbol, as_of, analysis_period)]
+
+    def build_index(self, fetch_history, symbols=None):
+        """Fill the index from the full price history of every symbol (or of the given ones)
+
+        fetch_history(symbol) returns a DataFrame indexed by date with a "close" column (or None).
+        """
+        for symbol in symbols if symbols is not None else self.symbols:
+            try:
+                df = fetch_history(symbol)
+            except ImportError:
+                raise
+            except Exception:
+                # Left out of the index, it is fetched again at the next load
+                logger.warning(f"History of {symbol} not fetched for the symbol index", exc_info=True)
+                continue
+            if df is None or len(df) == 0:
+                # No data: kept (an unknown listing date never skips the symbol) without fetching it at every load
+                self.index[symbol] = {"listing_date": None, "typical_price": None}
+                continue
+
+            # Typical price is the median close over the last year of data
+            last_year = df[df.index >= df.index[-1] - timedelta(days=365)]
+            self.index[symbol] = {
+                "listing_date": df.index[0].date(),
+                "typical_price": round(float(last_year["close"].median()), 2),
+            }
+
+
+def fetch_yahoo_history(symbol):
+    """Full daily history of a symbol from Yahoo Finance"""
+    import yfinance as yf
+
+    df = yf.Ticker(symbol).history(period="max", auto_adjust=False)
+    if df.empty:
+        return None
+    df.index = df.index.tz_localize(None)
+    return df.rename(columns=str.lower)
+
+
+if __name__ == "__main__":
+    # Build the index file for the whole universe
+    universe = SymbolUniverse()
+    universe.build_index(fetch_yahoo_history)
+    universe.save()
+
+    for symbol in universe.symbols:
+        print(universe.metadata(symbol))